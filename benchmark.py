@@ -0,0 +1,658 @@
+"""
+Synthetic-scale benchmarks for `standardize_pft_funcs`.
+
+Times and memory-profiles the functions that dominate a standardization
+run (`get_unique_species`, `join_to_checklist`, `add_leaf_retention`,
+`add_geospatial_aux` and `find_duplicates`) on deterministic synthetic
+data, so the scaling of each function can be measured without the real
+(unshareable) inputs and without network access. The generator builds an
+AKVEG-like checklist with synonyms, a leaf retention table, a long species
+cover table, plot points with exact and near duplicates, and polygon
+layers (a region tiling and overlapping, partly invalid, fire perimeters)
+at the sizes of each tier in `TIERS`. The parallel spatial join
+(`add_geospatial_aux_parallel`, two worker processes) is first checked
+against the serial result (see `CHECKS`).
+
+Every function is run `--repeat` times per tier (the min and median wall
+times are recorded) and once more under `tracemalloc` for its peak traced
+memory. The import time of the modules in `IMPORTS` is measured the same
+way, each import in a fresh interpreter (tier 'import', with the peak
+RSS of that interpreter as its memory), so slow startups are caught
+too. Memory allocated by C libraries outside of numpy (e.g. GEOS and
+GDAL) is not traced. Results are written as JSON (default
+etc/benchmarks/latest.json) and compared with a stored baseline (default
+etc/benchmarks/baseline.json): a function that got slower or uses more
+memory than the baseline allows (see `--time-tolerance` and
+`--memory-tolerance`) is flagged, and the script exits with status 1.
+
+Usage:
+    python benchmark.py                          # every function, small and medium tiers
+    python benchmark.py --tiers small medium large
+    python benchmark.py join_to_checklist --repeat 5
+    python benchmark.py --save-baseline          # store this run as the baseline
+"""
+
+import argparse
+import contextlib
+import datetime
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+import standardize_pft_funcs as spf
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# synthetic input sizes per tier
+TIERS = {'small': {'checklist': 2_000, 'plots': 500, 'species_per_plot': 20,
+                   'regions': 16, 'fires': 200},
+         'medium': {'checklist': 20_000, 'plots': 5_000, 'species_per_plot': 25,
+                    'regions': 64, 'fires': 2_000},
+         'large': {'checklist': 100_000, 'plots': 50_000, 'species_per_plot': 30,
+                   'regions': 256, 'fires': 20_000}}
+
+# checklist habits, as in the AKVEG 'Habit' column
+HABITS = ['shrub', 'shrub, tree', 'tree', 'forb', 'graminoid', 'moss',
+          'liverwort', 'lichen', 'algae', 'spore-bearing']
+
+# syllables of the synthetic latin names
+SYLLABLES = ['al', 'an', 'ar', 'ba', 'ca', 'ce', 'ci', 'da', 'de', 'do', 'el', 'er',
+             'fa', 'ga', 'gi', 'ha', 'in', 'la', 'le', 'li', 'lo', 'ma', 'me', 'mi',
+             'na', 'ne', 'no', 'or', 'pa', 'pe', 'ra', 're', 'ri', 'ro', 'sa', 'se',
+             'si', 'ta', 'te', 'ti', 'to', 'um', 'ur', 'us', 'va', 've', 'xa', 'za']
+
+# extent of the synthetic plots and layers, in EPSG:5936 meters (mainland
+# alaska, away from the antimeridian)
+EXTENT = (1_100_000.0, -1_400_000.0, 2_500_000.0, -200_000.0)
+INTERSECT_EPSG = 'EPSG:5936'
+
+# modules whose import time is benchmarked, e.g. the startup cost of a
+# batch job or worker process
+IMPORTS = ['standardize_pft_funcs', 'pipeline', 'pavc_query', 'pavc']
+
+
+##########################################################################################
+# Synthetic data: function(sizes, rng, ...) -> dataframe or path
+##########################################################################################
+
+def synthetic_checklist(n_names, rng):
+
+    """
+    Synthetic AKVEG species checklist with the columns of `spf.checklist_df`.
+    About 70% of the rows are accepted names (10% of them infraspecific),
+    the rest are synonyms of an accepted name. Habits are mostly shared
+    within a genus, and some names have no habit.
+
+    n_names                (int): approximate number of checklist rows
+    rng (numpy.random.Generator): random number generator
+    """
+
+    n_genera = max(n_names // 10, 1)
+    genera = np.unique(synthetic_words(rng, n_genera, 2, 4, capitalize=True))
+    n_accepted = max(int(n_names * 0.7), 1)
+
+    # accepted names: genus + epithet, some with a subspecies or variety
+    genus = genera[rng.integers(len(genera), size=n_accepted)]
+    accepted = genus + ' ' + synthetic_words(rng, n_accepted, 2, 4)
+    infra = rng.random(n_accepted) < 0.1
+    rank = rng.choice(np.array([' ssp. ', ' var. '], dtype=object), size=infra.sum())
+    accepted[infra] = accepted[infra] + rank + synthetic_words(rng, infra.sum(), 2, 3)
+    accepted = pd.unique(accepted)
+
+    # synonyms point to a random accepted name
+    n_synonyms = max(n_names - len(accepted), 0)
+    target = accepted[rng.integers(len(accepted), size=n_synonyms)]
+    synonym_genus = np.where(rng.random(n_synonyms) < 0.5,
+                             genera[rng.integers(len(genera), size=n_synonyms)],
+                             pd.Series(target).str.split().str[0].to_numpy(dtype=object))
+    synonyms = synonym_genus + ' ' + synthetic_words(rng, n_synonyms, 2, 4)
+
+    names = np.concatenate([accepted, synonyms])
+    accepted_names = np.concatenate([accepted, target])
+    genus_habit = dict(zip(genera, rng.choice(np.array(HABITS, dtype=object), size=len(genera))))
+    habit = pd.Series(accepted_names).str.split().str[0].map(genus_habit).to_numpy(dtype=object)
+    other = rng.random(len(habit)) < 0.05
+    habit[other] = rng.choice(np.array(HABITS, dtype=object), size=other.sum())
+    habit[rng.random(len(habit)) < 0.02] = None
+
+    n = len(names)
+    return pd.DataFrame({'nameCode': [f'code{i}' for i in range(n)],
+                         'checklistSpeciesName': names,
+                         'nameStatus': np.where(np.arange(n) < len(accepted),
+                                                'accepted', 'synonym'),
+                         'nameAccepted': accepted_names,
+                         'nameFamily': 'Synthaceae',
+                         'acceptedNameSource': 'synthetic',
+                         'nameLevel': np.where(pd.Series(names).str.contains(' ssp. | var. '),
+                                               'infraspecies', 'species'),
+                         'speciesForm': 'vascular',
+                         'speciesHabit': habit})
+
+
+def synthetic_leaf_retention(checklist, rng):
+
+    """
+    Synthetic Macander 2022 leaf retention table with the columns of
+    `spf.leaf_retention_df`, covering half of the shrub and tree names.
+
+    checklist        (dataframe): output of `synthetic_checklist`
+    rng (numpy.random.Generator): random number generator
+    """
+
+    woody = checklist.loc[checklist['speciesHabit'].str.contains('shrub|tree', na=False),
+                          'nameAccepted'].drop_duplicates()
+    woody = woody[rng.random(len(woody)) < 0.5]
+    retention = rng.choice(np.array(['deciduous', 'evergreen'], dtype=object), size=len(woody))
+    return pd.DataFrame({'leafRetention': retention,
+                         'retentionSpeciesName': woody.to_numpy()})
+
+
+def synthetic_species_cover(checklist, n_plots, species_per_plot, rng):
+
+    """
+    Synthetic long species cover table ('plotName', 'datasetSpeciesName',
+    'percentCover'). Names are mostly checklist names (accepted or
+    synonyms), some with an author, genus-only names ('Genus sp.'),
+    unknowns, misspellings, and names that are not in the checklist.
+
+    checklist        (dataframe): output of `synthetic_checklist`
+    n_plots                (int): number of plots
+    species_per_plot       (int): mean number of species per plot
+    rng (numpy.random.Generator): random number generator
+    """
+
+    # a dataset only uses part of the checklist
+    pool = checklist['checklistSpeciesName'].to_numpy(dtype=object)
+    pool = pool[rng.random(len(pool)) < min(1.0, 20 * species_per_plot / len(pool) + 0.05)]
+    counts = rng.poisson(species_per_plot, size=n_plots).clip(1)
+    n = counts.sum()
+    names = pool[rng.integers(len(pool), size=n)]
+
+    # variants of the checklist names
+    kind = rng.random(n)
+    author = kind < 0.05
+    names[author] = names[author] + ' (L.) Synth.'
+    genus_only = (kind >= 0.05) & (kind < 0.10)
+    names[genus_only] = pd.Series(names[genus_only]).str.split().str[0].to_numpy() + ' sp.'
+    unknown = (kind >= 0.10) & (kind < 0.12)
+    names[unknown] = 'Unknown ' + pd.Series(names[unknown]).str.split().str[0].to_numpy()
+    typo = (kind >= 0.12) & (kind < 0.15)
+    names[typo] = misspell(names[typo], rng)
+    absent = (kind >= 0.15) & (kind < 0.17)
+    names[absent] = ('Novum ' + synthetic_words(rng, absent.sum(), 2, 4))
+
+    plots = np.repeat(np.array([f'plot{i:07d}' for i in range(n_plots)], dtype=object), counts)
+    cover = np.round(rng.gamma(0.6, 8.0, size=n), 1)
+    cover[rng.random(n) < 0.02] = 0.0
+    return pd.DataFrame({'plotName': plots,
+                         'datasetSpeciesName': names,
+                         'percentCover': cover})
+
+
+def synthetic_plots(n_plots, rng):
+
+    """
+    Synthetic plot points (geodataframe in `INTERSECT_EPSG`) with the
+    coordinate and survey date columns used by `spf.find_duplicates`.
+    About 5% of the plots repeat the coordinates of another plot, 5%
+    are within a few meters of another plot, and survey dates are drawn
+    from a few field seasons, so both exact and near duplicates exist.
+
+    n_plots                (int): number of plots
+    rng (numpy.random.Generator): random number generator
+    """
+
+    xmin, ymin, xmax, ymax = EXTENT
+    x = rng.uniform(xmin, xmax, size=n_plots)
+    y = rng.uniform(ymin, ymax, size=n_plots)
+    exact = rng.random(n_plots) < 0.05
+    source = rng.integers(n_plots, size=n_plots)
+    x[exact], y[exact] = x[source[exact]], y[source[exact]]
+    near = ~exact & (rng.random(n_plots) < 0.05)
+    x[near] = x[source[near]] + rng.normal(0, 3, size=near.sum())
+    y[near] = y[source[near]] + rng.normal(0, 3, size=near.sum())
+
+    points = gpd.GeoSeries(gpd.points_from_xy(x, y), crs=INTERSECT_EPSG)
+    lonlat = points.to_crs('EPSG:4326')
+    plots = gpd.GeoDataFrame({'plotName': [f'plot{i:07d}' for i in range(n_plots)],
+                              'longitudeX': lonlat.x.round(5).to_numpy(),
+                              'latitudeY': lonlat.y.round(5).to_numpy(),
+                              'surveyYear': rng.integers(2010, 2016, size=n_plots),
+                              'surveyMonth': rng.integers(6, 9, size=n_plots),
+                              'surveyDay': rng.integers(1, 29, size=n_plots)},
+                             geometry=points.values, crs=INTERSECT_EPSG)
+    return plots.set_index('plotName')
+
+
+def synthetic_regions(path, n_regions, rng):
+
+    """
+    Writes a synthetic administrative region layer (a square tiling of the
+    extent with 'name1' and 'name0' columns, like GAUL level 1) to a
+    shapefile in EPSG:4326 and returns its path.
+
+    path                (string): path to the shapefile to write
+    n_regions              (int): approximate number of regions
+    rng (numpy.random.Generator): random number generator
+    """
+
+    xmin, ymin, xmax, ymax = EXTENT
+    side = max(int(round(np.sqrt(n_regions))), 1)
+    xs = np.linspace(xmin, xmax, side + 1)
+    ys = np.linspace(ymin, ymax, side + 1)
+    x0, y0 = [a.ravel() for a in np.meshgrid(xs[:-1], ys[:-1])]
+    x1, y1 = [a.ravel() for a in np.meshgrid(xs[1:], ys[1:])]
+    boxes = shapely.box(x0, y0, x1, y1)
+    regions = gpd.GeoDataFrame({'name1': synthetic_words(rng, len(boxes), 2, 4, capitalize=True),
+                                'name0': 'Synthland'},
+                               geometry=boxes, crs=INTERSECT_EPSG)
+    regions.to_crs('EPSG:4326').to_file(path)
+    return path
+
+
+def synthetic_fires(path, n_fires, rng):
+
+    """
+    Writes a synthetic fire perimeter layer (overlapping ellipses with
+    a 'FIRE_YEAR' column; 1% are self-intersecting bow ties that have to
+    be repaired) to a shapefile in EPSG:4326 and returns its path.
+
+    path                (string): path to the shapefile to write
+    n_fires                (int): number of fire perimeters
+    rng (numpy.random.Generator): random number generator
+    """
+
+    xmin, ymin, xmax, ymax = EXTENT
+    centers = shapely.points(rng.uniform(xmin, xmax, size=n_fires),
+                             rng.uniform(ymin, ymax, size=n_fires))
+    area = (xmax - xmin) * (ymax - ymin)
+    radius = rng.lognormal(np.log(np.sqrt(area / n_fires) / 2), 0.6, size=n_fires)
+    circles = shapely.buffer(centers, radius, quad_segs=4)
+
+    # stretch the circles into ellipses around their centers
+    coords, index = shapely.get_coordinates(circles, return_index=True)
+    center = shapely.get_coordinates(centers)[index]
+    stretch = rng.uniform(0.5, 2.0, size=n_fires)[index]
+    coords = center + (coords - center) * np.c_[stretch, 1 / stretch]
+    fires = shapely.set_coordinates(circles.copy(), coords)
+
+    # self-intersecting bow ties
+    bowtie = np.flatnonzero(rng.random(n_fires) < 0.01)
+    x, y = shapely.get_x(centers[bowtie]), shapely.get_y(centers[bowtie])
+    r = radius[bowtie]
+    coords = np.stack([np.c_[x - r, y - r], np.c_[x + r, y + r],
+                       np.c_[x + r, y - r], np.c_[x - r, y + r],
+                       np.c_[x - r, y - r]], axis=1)
+    fires[bowtie] = shapely.polygons(coords)
+
+    fires = gpd.GeoDataFrame({'FIRE_YEAR': rng.integers(1940, 2024, size=n_fires)},
+                             geometry=fires, crs=INTERSECT_EPSG)
+    fires.to_crs('EPSG:4326').to_file(path)
+    return path
+
+
+# function to make n random lowercase (or capitalized) words of a few
+# syllables; the same rng state always gives the same words
+def synthetic_words(rng, n, low, high, capitalize=False):
+
+    syllables = np.array(SYLLABLES, dtype=object)
+    lengths = rng.integers(low, high + 1, size=n)
+    parts = syllables[rng.integers(len(syllables), size=(n, high))]
+    words = parts[:, 0].copy()
+    for i in range(1, high):
+        words = np.where(lengths > i, words + parts[:, i], words)
+    if capitalize:
+        words = pd.Series(words, dtype=object).str.capitalize().to_numpy(dtype=object)
+    return words
+
+
+# function to swap two adjacent letters in each name
+def misspell(names, rng):
+
+    names = names.astype(object)
+    for i, name in enumerate(names):
+        j = rng.integers(1, max(len(name) - 1, 2))
+        names[i] = name[:j - 1] + name[j] + name[j - 1] + name[j + 1:]
+    return names
+
+
+def synthetic_data(sizes, seed, tmpdir):
+
+    """
+    Main function that generates every synthetic input of a tier.
+    Returns a dictionary with 'checklist', 'leaf_retention', 'species',
+    'plots' and 'layers' (list of (path, name, columns)).
+
+    sizes  (dict): sizes of the tier, e.g. `TIERS['small']`
+    seed    (int): seed of the random number generator
+    tmpdir (string): directory to write the polygon layers to
+    """
+
+    rng = np.random.default_rng(seed)
+    checklist = synthetic_checklist(sizes['checklist'], rng)
+    data = {'checklist': checklist,
+            'leaf_retention': synthetic_leaf_retention(checklist, rng),
+            'species': synthetic_species_cover(checklist, sizes['plots'],
+                                               sizes['species_per_plot'], rng),
+            'plots': synthetic_plots(sizes['plots'], rng)}
+    regions = synthetic_regions(os.path.join(tmpdir, 'regions.shp'), sizes['regions'], rng)
+    fires = synthetic_fires(os.path.join(tmpdir, 'fires.shp'), sizes['fires'], rng)
+    data['layers'] = [(regions, 'gaul1', ['name1', 'name0', 'geometry']),
+                      (fires, 'fire', ['FIRE_YEAR', 'geometry'])]
+    return data
+
+
+##########################################################################################
+# Cases: function(data) -> callable that runs the benchmarked function once
+##########################################################################################
+
+def case_get_unique_species(data):
+
+    species = data['species']
+    return lambda: spf.get_unique_species(species, 'datasetSpeciesName', 'benchmark')
+
+
+def case_join_to_checklist(data):
+
+    unique_species = spf.get_unique_species(data['species'], 'datasetSpeciesName', 'benchmark')
+    checklist = data['checklist']
+    return lambda: spf.join_to_checklist(unique_species.copy(), checklist,
+                                         'datasetSpeciesName', 'checklistSpeciesName',
+                                         'nameAccepted', 'joinKey',
+                                         'speciesHabit')
+
+
+def case_add_leaf_retention(data):
+
+    unique_species = spf.get_unique_species(data['species'], 'datasetSpeciesName', 'benchmark')
+    with contextlib.redirect_stdout(io.StringIO()):
+        habits = spf.join_to_checklist(unique_species, data['checklist'],
+                                       'datasetSpeciesName', 'checklistSpeciesName',
+                                       'nameAccepted', 'joinKey',
+                                       'speciesHabit')
+    leaf_retention = data['leaf_retention']
+    return lambda: spf.add_leaf_retention(habits.copy(), leaf_retention, 'leafRetention')
+
+
+def case_add_geospatial_aux(data, n_jobs=None):
+
+    # every run reads, reprojects and repairs the layers (no cache_dir)
+    plots = data['plots']
+    paths, names, colnames = [list(values) for values in zip(*data['layers'])]
+    def run():
+        spf.PREPARED_LAYERS.clear()
+        return spf.add_geospatial_aux(plots, paths, names, colnames, INTERSECT_EPSG,
+                                      n_jobs=n_jobs)
+    return run
+
+
+def case_add_geospatial_aux_parallel(data):
+
+    # the process pool path (two workers, several chunks per worker)
+    return case_add_geospatial_aux(data, n_jobs=2)
+
+
+def case_find_duplicates(data):
+
+    plots = pd.DataFrame(data['plots'].drop(columns='geometry'))
+    coords = ['longitudeX', 'latitudeY']
+    date = ['surveyYear', 'surveyMonth', 'surveyDay']
+    return lambda: spf.find_duplicates(plots, [coords, date],
+                                       ['duplicatedCoords', 'duplicatedDate'])
+
+
+CASES = {'get_unique_species': case_get_unique_species,
+         'join_to_checklist': case_join_to_checklist,
+         'add_leaf_retention': case_add_leaf_retention,
+         'add_geospatial_aux': case_add_geospatial_aux,
+         'add_geospatial_aux_parallel': case_add_geospatial_aux_parallel,
+         'find_duplicates': case_find_duplicates}
+
+
+# function to check that the parallel spatial join returns the same
+# frame as the serial one
+def check_add_geospatial_aux_parallel(data):
+
+    pd.testing.assert_frame_equal(case_add_geospatial_aux_parallel(data)(),
+                                  case_add_geospatial_aux(data)())
+
+
+# checks run once per tier before a case is timed; a failing check stops
+# the benchmark
+CHECKS = {'add_geospatial_aux_parallel': check_add_geospatial_aux_parallel}
+
+
+##########################################################################################
+# Runner functions
+##########################################################################################
+
+def run_benchmarks(functions=None, tiers=('small', 'medium'), repeat=3, seed=0,
+                   imports=IMPORTS):
+
+    """
+    Main function that generates the synthetic data of every tier and
+    times and memory-profiles the benchmarked functions on it. Returns a
+    results dictionary (see `machine_info` for its 'machine' entry) with
+    one 'results' record per function and tier: its 'seconds' (min,
+    median and every run), 'peak_memory_bytes' (tracemalloc peak of one
+    extra run), and the input sizes. Module imports are recorded as
+    'import <module>' in tier 'import' (see `time_import`).
+
+    functions (list): names of the `CASES` to run (default all)
+    tiers     (list): names of the `TIERS` to run
+    repeat     (int): number of timed runs per function and tier
+    seed       (int): seed of the synthetic data generator
+    imports   (list): modules whose import time is measured
+    """
+
+    functions = list(CASES) if functions is None else list(functions)
+    records = []
+    for module in imports:
+        runs = [time_import(module) for _ in range(repeat)]
+        seconds = [run[0] for run in runs]
+        peak = max(run[1] for run in runs)
+        records.append({'function': f'import {module}', 'tier': 'import', 'sizes': {},
+                        'rows': 0,
+                        'seconds': {'min': min(seconds),
+                                    'median': statistics.median(seconds),
+                                    'runs': seconds},
+                        'peak_memory_bytes': peak})
+        print(f'[import] {module}: {min(seconds):.3f} s, {peak / 2**20:.1f} MiB RSS',
+              flush=True)
+    for tier in tiers:
+        sizes = TIERS[tier]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            start = time.perf_counter()
+            data = synthetic_data(sizes, seed, tmpdir)
+            print(f'[{tier}] generated {len(data["species"])} species rows in '
+                  f'{time.perf_counter() - start:.1f} s', flush=True)
+            for name in functions:
+                if name in CHECKS:
+                    CHECKS[name](data)
+                func = CASES[name](data)
+                seconds, peak = profile(func, repeat)
+                records.append({'function': name, 'tier': tier, 'sizes': sizes,
+                                'rows': len(data['species']),
+                                'seconds': {'min': min(seconds),
+                                            'median': statistics.median(seconds),
+                                            'runs': seconds},
+                                'peak_memory_bytes': peak})
+                print(f'[{tier}] {name}: {min(seconds):.3f} s, '
+                      f'{peak / 2**20:.1f} MiB', flush=True)
+        spf.PREPARED_LAYERS.clear()
+    return {'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'seed': seed, 'repeat': repeat, 'machine': machine_info(),
+            'results': records}
+
+
+def compare_results(results, baseline, time_tolerance=0.25, memory_tolerance=0.25,
+                    min_seconds=0.01):
+
+    """
+    Main function that compares benchmark results with a baseline (both
+    from `run_benchmarks`). Returns a dataframe with one row per function
+    and tier, the time and memory ratios to the baseline, and a 'status'
+    of 'ok', 'slower', 'more memory', 'slower, more memory', 'new' (not in
+    the baseline) or 'sizes changed' (baseline used other tier sizes).
+
+    results          (dict): output of `run_benchmarks`
+    baseline         (dict): stored output of `run_benchmarks`
+    time_tolerance  (float): allowed relative increase of the min time
+    memory_tolerance (float): allowed relative increase of the peak memory
+    min_seconds     (float): time differences below this are never flagged
+    """
+
+    previous = {(r['function'], r['tier']): r for r in baseline.get('results', [])}
+    rows = []
+    for record in results['results']:
+        old = previous.get((record['function'], record['tier']))
+        row = {'function': record['function'], 'tier': record['tier'],
+               'seconds': record['seconds']['min'],
+               'peak_memory_bytes': record['peak_memory_bytes'],
+               'time_ratio': np.nan, 'memory_ratio': np.nan}
+        if old is None:
+            row['status'] = 'new'
+        elif old['sizes'] != record['sizes']:
+            row['status'] = 'sizes changed'
+        else:
+            new_time, old_time = record['seconds']['min'], old['seconds']['min']
+            row['time_ratio'] = new_time / old_time if old_time else np.inf
+            if record['peak_memory_bytes'] and old['peak_memory_bytes']:
+                row['memory_ratio'] = record['peak_memory_bytes'] / old['peak_memory_bytes']
+            flags = []
+            if (row['time_ratio'] > 1 + time_tolerance
+                    and new_time - old_time > min_seconds):
+                flags.append('slower')
+            if row['memory_ratio'] > 1 + memory_tolerance:
+                flags.append('more memory')
+            row['status'] = ', '.join(flags) or 'ok'
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+# function to time a callable `repeat` times and trace its peak memory
+# in one extra run; printed output (e.g. progress messages) is discarded
+def profile(func, repeat):
+
+    seconds = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            gc.collect()
+            start = time.perf_counter()
+            func()
+            seconds.append(time.perf_counter() - start)
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return seconds, peak
+
+
+# function to import a module in a fresh interpreter; returns the import's
+# wall time and the interpreter's peak RSS in bytes (0 where it cannot be
+# read). The RSS is read from /proc where possible, as ru_maxrss is kept
+# across exec and would report the peak of this (much larger) process
+def time_import(module):
+
+    code = f"""import time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+rss = 0
+try:
+    with open('/proc/self/status') as file:
+        rss = next(int(line.split()[1]) * 1024 for line in file if line.startswith('VmHWM'))
+except (OSError, StopIteration):
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:
+        pass
+print(seconds, rss)"""
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout.split()
+    return float(output[-2]), int(output[-1])
+
+
+# function to describe the machine and library versions of a run
+def machine_info():
+
+    return {'platform': platform.platform(), 'processor': platform.machine(),
+            'cpu_count': os.cpu_count(), 'python': platform.python_version(),
+            'numpy': np.__version__, 'pandas': pd.__version__,
+            'geopandas': gpd.__version__, 'shapely': shapely.__version__,
+            'standardize_pft_funcs': spf.__version__}
+
+
+# function to write json atomically
+def write_json(obj, path):
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path + '.tmp', 'w') as file:
+        json.dump(obj, file, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Benchmark standardize_pft_funcs '
+                                                 'on synthetic data.')
+    parser.add_argument('functions', nargs='*',
+                        help=f'functions to benchmark (default: all of {", ".join(CASES)})')
+    parser.add_argument('--tiers', nargs='+', default=['small', 'medium'], choices=list(TIERS),
+                        help='data size tiers to run')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of timed runs per function and tier')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed of the synthetic data generator')
+    parser.add_argument('--output', default=os.path.join(ROOT, 'etc', 'benchmarks', 'latest.json'),
+                        help='where to write the results')
+    parser.add_argument('--baseline', default=os.path.join(ROOT, 'etc', 'benchmarks', 'baseline.json'),
+                        help='stored results to compare with')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='also store the results as the new baseline')
+    parser.add_argument('--time-tolerance', type=float, default=0.25,
+                        help='allowed relative slowdown before flagging a regression')
+    parser.add_argument('--memory-tolerance', type=float, default=0.25,
+                        help='allowed relative memory increase before flagging a regression')
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.functions if name not in CASES]
+    if unknown:
+        parser.error(f'unknown functions: {unknown}')
+
+    results = run_benchmarks(args.functions or None, args.tiers, args.repeat, args.seed)
+    write_json(results, args.output)
+    print(f'results written to {args.output}')
+
+    regressions = False
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        comparison = compare_results(results, baseline, args.time_tolerance,
+                                     args.memory_tolerance)
+        print(comparison.to_string(index=False, float_format='{:.3f}'.format))
+        regressions = comparison['status'].str.contains('slower|more memory').any()
+    if args.save_baseline:
+        write_json(results, args.baseline)
+        print(f'baseline written to {args.baseline}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
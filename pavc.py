@@ -0,0 +1,102 @@
+"""
+Command-line entry point for standardizing, harmonizing and validating
+the PAVC tables.
+
+Each subcommand only imports what it needs, so the CLI starts fast and
+batch jobs do not pay for geospatial or network libraries they never
+use: 'standardize' runs the per-source pipeline (see `pipeline.py`),
+while 'harmonize' and 'validate' only read and write the columnar output
+store through `standardize_pft_funcs`.
+
+Usage:
+    python pavc.py standardize abr nga --jobs 2   # same options as pipeline.py
+    python pavc.py harmonize                      # harmonize changed store partitions
+    python pavc.py validate --harmonized -o violations.csv
+"""
+
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# tables of the output store written by every source
+STORE_TABLES = ['standard_pft_fcover', 'plot_info', 'nonstandard_species_fcover']
+
+
+def standardize(argv):
+
+    import pipeline
+    return pipeline.main(argv)
+
+
+def harmonize(args):
+
+    import standardize_pft_funcs as spf
+    for table in args.tables:
+        spf.harmonize_store_table(args.store, table, index='plotName', rebuild=args.rebuild,
+                                  read=False)
+    return 0
+
+
+def validate(args):
+
+    import pandas as pd
+    import standardize_pft_funcs as spf
+    violations = []
+    for table in args.tables:
+        name = f'harmonized_{table}' if args.harmonized else table
+        table_violations = spf.validate_store_table(args.store, name, sources=args.sources)
+        table_violations.insert(0, 'table', name)
+        violations.append(table_violations)
+    violations = pd.concat(violations, ignore_index=True)
+
+    counts = violations.groupby(['table', 'code'], observed=True).size()
+    for (table, code), count in counts.items():
+        print(f'{table}: {count} rows violate {code}')
+    print(f'{len(violations)} violations')
+    if args.output:
+        violations.to_csv(args.output, index=False, encoding='utf-8-sig')
+    return 1 if args.strict and len(violations) else 0
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Standardize, harmonize and validate '
+                                                 'the PAVC tables.')
+    parser.add_argument('--store', default=os.path.join(ROOT, 'output_store'),
+                        help='output store directory')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('standardize', add_help=False,
+                        help='run the per-source pipeline (takes the options of pipeline.py)')
+    harmonized = commands.add_parser('harmonize', help='harmonize the store tables')
+    harmonized.add_argument('--tables', nargs='+', default=STORE_TABLES)
+    harmonized.add_argument('--rebuild', action='store_true',
+                            help='rebuild every partition, not only the changed ones')
+    checks = commands.add_parser('validate', help='check the store tables against '
+                                                  'the cover and plot information rules')
+    checks.add_argument('--tables', nargs='+', default=STORE_TABLES)
+    checks.add_argument('--harmonized', action='store_true',
+                        help='check the harmonized tables')
+    checks.add_argument('--sources', nargs='+', help='sources to check (default all)')
+    checks.add_argument('-o', '--output', help='csv to write the violations to')
+    checks.add_argument('--strict', action='store_true',
+                        help='exit with status 1 if there are violations')
+    argv = sys.argv[1:] if argv is None else list(argv)
+    args, extra = parser.parse_known_args(argv)
+
+    # everything after 'standardize' is passed on to pipeline.py as is
+    if args.command == 'standardize':
+        pipeline_argv = argv[argv.index('standardize') + 1:]
+        if args.store != parser.get_default('store'):
+            pipeline_argv += ['--store-dir', os.path.relpath(args.store, ROOT)]
+        return standardize(pipeline_argv)
+    if extra:
+        parser.error(f'unrecognized arguments: {" ".join(extra)}')
+    if args.command == 'harmonize':
+        return harmonize(args)
+    return validate(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
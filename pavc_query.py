@@ -0,0 +1,685 @@
+"""
+Spatially indexed queries over the synthesized PAVC plot database.
+
+`build_store` joins `synthesized_pft_fcover.csv` and
+`survey_unit_information.csv` on unit_id once and writes a persistent
+column store: one memory-mapped .npy file per column, with rows sorted
+along a Hilbert curve over the plot coordinates (`longitude_x`,
+`latitude_y`). On top of the rows it keeps a packed R-tree (bounding
+boxes of runs of `NODE_SIZE` consecutive rows, and of runs of those
+nodes, up to a single root) and sorted secondary indexes on
+`INDEXED_COLUMNS`. The store is only rebuilt when the input files (or
+this module's store format) change.
+
+`query_plots` answers bounding box, polygon, survey window (years and
+months), bioclimate subzone, data source, and PFT cover threshold
+queries. The most selective indexed condition selects the candidate
+rows, and the other conditions only read the candidate rows of their
+columns. Only the matching rows of the requested columns are read from
+disk, so queries do not scan or load the whole database.
+
+`grid_pft_cover` bins the plots onto a projected grid (EPSG:5936 by
+default) and writes per-cell count, mean, median and standard deviation
+of every PFT cover column as a tiled GeoTIFF, streaming over chunks of
+the store.
+
+e.g. store = pavc_query.open_store('etc/cache/plot_store')
+     plots = pavc_query.query_plots(store, bbox=(-165, 66, -160, 69),
+                                    years=(2010, 2019), subzones=[3, 4],
+                                    pft={'evergreen_shrub_cover': 10})
+
+Usage:
+    python pavc_query.py build
+    python pavc_query.py query --bbox -165 66 -160 69 --years 2010 2019 --subzones 3 4
+    python pavc_query.py query --sources ava akveg --min lichen_cover=20 -o lichen_plots.csv
+    python pavc_query.py grid pft_fcover_grid_1km.tif --resolution 1000
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+import standardize_pft_funcs as spf
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# version of the store layout; stores of other versions are rebuilt
+STORE_VERSION = 1
+
+# number of rows (and of child nodes) per R-tree node
+NODE_SIZE = 16
+
+# columns with a sorted secondary index
+INDEXED_COLUMNS = ['survey_year', 'bioclim_subzone', 'data_source']
+
+# integer plot information columns (nullable, as in the harmonization notebook)
+INTEGER_COLUMNS = ['survey_year', 'survey_month', 'survey_day', 'bioclim_subzone']
+
+# per-cell statistics of every cover column written by `grid_pft_cover`
+GRID_STATISTICS = ['count', 'mean', 'median', 'std']
+
+# text columns with at most this share of distinct values are stored as
+# dictionary codes; others are stored as fixed-width utf-8 bytes
+DICTIONARY_SHARE = 0.25
+
+
+##########################################################################################
+# Main functions
+##########################################################################################
+
+@spf.traced
+def build_store(pft_path, info_path, store_dir, node_size=NODE_SIZE, rebuild=False):
+
+    """
+    Main function that builds the plot store from the synthesized PFT
+    fcover and survey unit information tables (inner join on unit_id; the
+    information table wins for shared columns). Rows are sorted along a
+    Hilbert curve over their coordinates (rows without coordinates last)
+    and written as one .npy file per column with a packed R-tree and
+    sorted secondary indexes (see `INDEXED_COLUMNS`). The store is
+    written to a temporary directory and moved into place, and is left
+    as is if it was built from the same input files. Returns store_dir.
+
+    pft_path  (string): path to synthesized_pft_fcover.csv
+    info_path (string): path to survey_unit_information.csv
+    store_dir (string): path to the store directory
+    node_size    (int): number of rows (and child nodes) per R-tree node
+    rebuild     (bool): rebuild even if the inputs did not change
+    """
+
+    # skip unchanged inputs
+    inputs = {'pft': spf.file_hash(pft_path), 'info': spf.file_hash(info_path)}
+    manifest_path = os.path.join(store_dir, 'store.json')
+    if not rebuild and os.path.exists(manifest_path):
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+        if (manifest['inputs'] == inputs and manifest['version'] == STORE_VERSION
+                and manifest['node_size'] == node_size):
+            return store_dir
+
+    # one row per plot with information and covers
+    info = pd.read_csv(info_path, index_col='unit_id', encoding='utf-8-sig')
+    pft = pd.read_csv(pft_path, index_col='unit_id', encoding='utf-8-sig')
+    pft = pft.drop(columns=[col for col in pft.columns if col in info.columns])
+    df = pd.concat([info, pft], axis=1, join='inner')
+    df = df.loc[:, ~df.columns.str.startswith('Unnamed:')]
+    for col in INTEGER_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('Int64')
+
+    # rows with coordinates in hilbert order, then rows without
+    x = pd.to_numeric(df['longitude_x'], errors='coerce').to_numpy(dtype=float)
+    y = pd.to_numeric(df['latitude_y'], errors='coerce').to_numpy(dtype=float)
+    located = np.isfinite(x) & np.isfinite(y)
+    keys = np.full(len(df), np.iinfo(np.int64).max, dtype=np.int64)
+    keys[located] = hilbert_keys(x[located], y[located])
+    order = np.argsort(keys, kind='stable')
+    df = df.iloc[order].reset_index()
+    n_located = int(located.sum())
+
+    tmp_dir = store_dir.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    # columns
+    columns = {}
+    for i, name in enumerate(df.columns):
+        columns[name] = write_column(df[name], os.path.join(tmp_dir, f'col{i:03d}'),
+                                     dictionary=name in INDEXED_COLUMNS)
+    np.save(os.path.join(tmp_dir, 'x.npy'), x[order][:n_located])
+    np.save(os.path.join(tmp_dir, 'y.npy'), y[order][:n_located])
+
+    # packed r-tree, from the leaves up
+    levels = pack_rtree(x[order][:n_located], y[order][:n_located], node_size)
+    for k, boxes in enumerate(levels):
+        np.save(os.path.join(tmp_dir, f'rtree{k}.npy'), boxes)
+
+    # sorted secondary indexes over non-null values
+    indexes = [name for name in INDEXED_COLUMNS if name in columns]
+    for name in indexes:
+        values, valid = column_keys(df[name], columns[name])
+        rows = np.flatnonzero(valid)
+        rows = rows[np.argsort(values[rows], kind='stable')]
+        np.save(os.path.join(tmp_dir, f'index.{name}.keys.npy'), values[rows])
+        np.save(os.path.join(tmp_dir, f'index.{name}.rows.npy'), rows)
+
+    manifest = {'version': STORE_VERSION, 'inputs': inputs, 'rows': len(df),
+                'located': n_located, 'node_size': node_size, 'levels': len(levels),
+                'columns': columns, 'indexes': indexes}
+    with open(os.path.join(tmp_dir, 'store.json'), 'w') as file:
+        json.dump(manifest, file, indent=1)
+
+    # swap the new store in
+    if os.path.exists(store_dir):
+        shutil.rmtree(store_dir)
+    os.replace(tmp_dir, store_dir)
+    return store_dir
+
+
+def open_store(store_dir):
+
+    """
+    Main function that opens a plot store built by `build_store`. All
+    arrays are memory-mapped, so opening reads only the manifest; pages
+    are read from disk when a query touches them. Returns a dictionary
+    with the 'manifest', the store 'dir', the located rows' 'x' and 'y',
+    the R-tree 'levels' (leaves first), and the secondary 'indexes'
+    (column name to (sorted keys, row ids)); other arrays are mapped
+    when a query first reads them.
+
+    store_dir (string): path to the store directory
+    """
+
+    with open(os.path.join(store_dir, 'store.json')) as file:
+        manifest = json.load(file)
+    if manifest['version'] != STORE_VERSION:
+        raise ValueError(f'{store_dir} has store version {manifest["version"]}; '
+                         f'rebuild it with build_store (version {STORE_VERSION})')
+    store = {'dir': store_dir, 'manifest': manifest}
+    store['x'] = load_array(store, 'x.npy')
+    store['y'] = load_array(store, 'y.npy')
+    store['levels'] = [load_array(store, f'rtree{k}.npy') for k in range(manifest['levels'])]
+    store['indexes'] = {name: (load_array(store, f'index.{name}.keys.npy'),
+                               load_array(store, f'index.{name}.rows.npy'))
+                        for name in manifest['indexes']}
+    return store
+
+
+@spf.traced
+def query_plots(store, bbox=None, polygon=None, years=None, months=None, subzones=None,
+                sources=None, pft=None, columns=None):
+
+    """
+    Main function that returns the plots that meet every given condition
+    as a dataframe indexed by unit_id (in store order, i.e. along the
+    Hilbert curve). The candidate rows come from the most selective of
+    the spatial and indexed conditions; the other conditions are checked
+    on the candidates only, and only the matching rows of the requested
+    columns are read.
+
+    store      (dict): output of `open_store`
+    bbox      (tuple): (min lon, min lat, max lon, max lat), inclusive
+    polygon (geometry): shapely (multi)polygon or WKT in longitude/latitude;
+                        plots on the boundary are included
+    years     (tuple): (first, last) survey year, inclusive
+    months    (tuple): (first, last) survey month, inclusive
+    subzones   (list): bioclimate subzones to keep
+    sources    (list): data sources to keep, e.g. ['ava', 'akveg']
+    pft        (dict): PFT cover thresholds, column name to a minimum or a
+                       (minimum, maximum) tuple (None for no bound), e.g.
+                       {'lichen_cover': 20, 'graminoid_cover': (None, 5)}
+    columns    (list): columns to return (default all)
+    """
+
+    manifest = store['manifest']
+    names = list(manifest['columns'])[1:] if columns is None else list(columns)
+    unknown = set(names) - set(manifest['columns'])
+    unknown |= set(pft or {}) - set(manifest['columns'])
+    if unknown:
+        raise KeyError(f'unknown columns: {sorted(unknown)}')
+
+    # conditions on indexed columns: name -> (sorted key ranges)
+    conditions = {}
+    if years is not None:
+        conditions['survey_year'] = [(years[0], years[1])]
+    if subzones is not None:
+        conditions['bioclim_subzone'] = [(z, z) for z in subzones]
+    if sources is not None:
+        conditions['data_source'] = [(s, s) for s in sources]
+    ranges = {name: index_ranges(store, name, bounds)
+              for name, bounds in conditions.items()}
+
+    # spatial candidates from the r-tree
+    rows = None
+    if polygon is not None:
+        import shapely
+        polygon = shapely.from_wkt(polygon) if isinstance(polygon, str) else polygon
+        box = polygon.bounds
+        if bbox is not None:
+            box = (max(box[0], bbox[0]), max(box[1], bbox[1]),
+                   min(box[2], bbox[2]), min(box[3], bbox[3]))
+        rows = query_rtree(store, box)
+        rows = rows[shapely.intersects_xy(polygon, store['x'][rows], store['y'][rows])]
+    elif bbox is not None:
+        rows = query_rtree(store, bbox)
+
+    # the smallest indexed condition drives if it is smaller
+    driver = min(ranges, key=lambda name: ranges[name][2], default=None)
+    if driver is not None and (rows is None or ranges[driver][2] < len(rows)):
+        keys_rows = store['indexes'][driver][1]
+        driven = np.sort(np.concatenate([keys_rows[a:b] for a, b in ranges[driver][0]]
+                                        or [np.array([], dtype=np.int64)]))
+        if rows is not None:
+            driven = np.intersect1d(driven, rows, assume_unique=True)
+        rows = driven
+        del ranges[driver]
+    if rows is None:
+        rows = np.arange(manifest['rows'])
+
+    # check the other conditions on the candidate rows only
+    for name, (_, values, _) in ranges.items():
+        keys, valid = read_keys(store, name, rows)
+        keep = np.zeros(len(rows), dtype=bool)
+        for low, high in values:
+            keep |= (keys >= low) & (keys <= high)
+        rows = rows[keep & valid]
+    if months is not None:
+        month = read_column(store, 'survey_month', rows)
+        rows = rows[month.between(months[0], months[1]).fillna(False).to_numpy(dtype=bool)]
+    for name, bounds in (pft or {}).items():
+        low, high = bounds if isinstance(bounds, (tuple, list)) else (bounds, None)
+        cover = read_column(store, name, rows).to_numpy(dtype=float, na_value=np.nan)
+        keep = ~np.isnan(cover)
+        if low is not None:
+            keep &= cover >= low
+        if high is not None:
+            keep &= cover <= high
+        rows = rows[keep]
+
+    # read the matching rows of the requested columns
+    unit_id = list(manifest['columns'])[0]
+    data = {name: read_column(store, name, rows) for name in [unit_id] + names}
+    return pd.DataFrame(data).set_index(unit_id)
+
+
+@spf.traced
+def grid_pft_cover(store, out_path, resolution=1000, epsg='EPSG:5936', columns=None,
+                   bounds=None, coord_epsg='EPSG:4326', chunk_rows=1 << 20,
+                   block_rows=256, tmp_dir=None):
+
+    """
+    Main function that bins the located plots of a store onto a projected
+    grid and writes per-cell statistics of every PFT cover column as a
+    tiled, compressed GeoTIFF with one band per column and statistic
+    (`GRID_STATISTICS`, named e.g. 'lichen_cover_median' in the band
+    descriptions), after a first 'plot_count' band. Count is the number of
+    plots with a cover value, std is the sample standard deviation, and
+    cells without values are NaN. Plots are read in chunks of chunk_rows
+    and spilled to temporary files per block of block_rows grid rows;
+    every block is then reduced with sorted-segment reductions and written
+    as one window, so memory holds one chunk or one block at a time.
+    Returns the list of band names.
+
+    store        (dict): output of `open_store`
+    out_path   (string): path to the GeoTIFF to write
+    resolution  (float): cell size in units of epsg (meters for EPSG:5936)
+    epsg       (string): projected CRS of the grid
+    columns      (list): cover columns to grid (default every float
+                         column ending in '_cover')
+    bounds      (tuple): optional grid (xmin, ymin, xmax, ymax) in epsg;
+                         by default the plots' extent (from the R-tree)
+    coord_epsg (string): CRS of longitude_x/latitude_y
+    chunk_rows    (int): number of plots read at a time
+    block_rows    (int): number of grid rows reduced and written at a time
+                         (also the GeoTIFF tile height)
+    tmp_dir    (string): optional directory for the spill files
+    """
+
+    import pyproj
+    import rasterio
+    from rasterio.transform import from_origin
+    from rasterio.windows import Window
+
+    manifest = store['manifest']
+    if columns is None:
+        columns = [name for name, entry in manifest['columns'].items()
+                   if entry['kind'] == 'float' and name.endswith('_cover')]
+    to_grid = pyproj.Transformer.from_crs(coord_epsg, epsg, always_xy=True)
+
+    # grid snapped to the resolution around the plots' extent
+    if bounds is None:
+        lon0, lat0, lon1, lat1 = store['levels'][-1][0]
+        bounds = to_grid.transform_bounds(lon0, lat0, lon1, lat1, densify_pts=21)
+    resolution = float(resolution)
+    xmin = np.floor(bounds[0] / resolution) * resolution
+    ymax = np.ceil(bounds[3] / resolution) * resolution
+    width = max(int(np.ceil((bounds[2] - xmin) / resolution)), 1)
+    height = max(int(np.ceil((ymax - bounds[1]) / resolution)), 1)
+    block_rows = max(min(block_rows // 16 * 16, height // 16 * 16), 16)
+    n_blocks = -(-height // block_rows)
+
+    names = ['plot_count'] + [f'{col}_{stat}' for col in columns for stat in GRID_STATISTICS]
+    schema = pa.schema([('cell', pa.int64())] + [(col, pa.float32()) for col in columns])
+    profile = {'driver': 'GTiff', 'width': width, 'height': height, 'count': len(names),
+               'dtype': 'float32', 'nodata': np.nan, 'crs': epsg,
+               'transform': from_origin(xmin, ymax, resolution, resolution),
+               'tiled': True, 'blockxsize': 256, 'blockysize': block_rows,
+               'compress': 'deflate', 'predictor': 3, 'BIGTIFF': 'IF_SAFER'}
+
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as tmp:
+
+        # spill the plots' cells and covers to their blocks of grid rows
+        for i, start in enumerate(range(0, manifest['located'], chunk_rows)):
+            rows = np.arange(start, min(start + chunk_rows, manifest['located']))
+            x, y = to_grid.transform(store['x'][rows], store['y'][rows])
+            col = np.floor((x - xmin) / resolution).astype(np.int64)
+            row = np.floor((ymax - y) / resolution).astype(np.int64)
+            inside = (col >= 0) & (col < width) & (row >= 0) & (row < height)
+            chunk = pd.DataFrame({'cell': row[inside] * width + col[inside]})
+            for name in columns:
+                chunk[name] = read_column(store, name, rows[inside]).to_numpy(dtype=np.float32)
+            if len(chunk):
+                spf.spill_unit_ranges(chunk, row[inside] // block_rows, tmp,
+                                      f'chunk-{i:08d}', schema)
+
+        # reduce and write one block of grid rows at a time
+        with rasterio.open(out_path + '.tmp', 'w', **profile) as raster:
+            for band, name in enumerate(names, start=1):
+                raster.set_band_description(band, name)
+            for b in range(n_blocks):
+                top = b * block_rows
+                rows_in_block = min(block_rows, height - top)
+                paths = sorted(glob.glob(os.path.join(tmp, f'range-{b}', '*.arrow')))
+                tables = [spf.read_arrow_stream(path) for path in paths] or [schema.empty_table()]
+                block = pa.concat_tables(tables)
+                values = np.empty((len(block), len(columns)), dtype=np.float32)
+                for j, name in enumerate(columns):
+                    values[:, j] = block.column(name).to_numpy()
+                cells, stats = grid_statistics(block.column('cell').to_numpy(), values)
+                window = Window(0, top, width, rows_in_block)
+                position = cells - top * width
+                for band, name in enumerate(names, start=1):
+                    values = np.full(rows_in_block * width, np.nan, dtype=np.float32)
+                    if name == 'plot_count':
+                        values[position] = stats['plot_count']
+                    else:
+                        col, stat = name.rsplit('_', 1)
+                        values[position] = stats[stat][:, columns.index(col)]
+                    raster.write(values.reshape(rows_in_block, width), band, window=window)
+    os.replace(out_path + '.tmp', out_path)
+    return names
+
+
+##########################################################################################
+# Store helper functions
+##########################################################################################
+
+# function to get 2**bits x 2**bits hilbert curve positions of points,
+# scaled to the points' extent (vectorized over points, looped over bits)
+def hilbert_keys(x, y, bits=16):
+
+    side = (1 << bits) - 1
+    span = lambda v: (v - v.min()) / max(v.max() - v.min(), 1e-12) * side
+    xi = span(x).astype(np.int64)
+    yi = span(y).astype(np.int64)
+    keys = np.zeros(len(xi), dtype=np.int64)
+    s = 1 << (bits - 1)
+    while s > 0:
+        rx = (xi & s) > 0
+        ry = (yi & s) > 0
+        keys += s * s * ((3 * rx.astype(np.int64)) ^ ry.astype(np.int64))
+
+        # rotate the quadrant so the curve stays continuous
+        flip = ~ry & rx
+        xi[flip] = side - xi[flip]
+        yi[flip] = side - yi[flip]
+        swap = ~ry
+        xi[swap], yi[swap] = yi[swap], xi[swap]
+        s >>= 1
+    return keys
+
+
+# function to pack an r-tree over points that are already in hilbert
+# order: each node is the bounding box of node_size consecutive children;
+# returns the (n, 4) box arrays of every level, leaves first
+def pack_rtree(x, y, node_size):
+
+    boxes = np.c_[x, y, x, y] if len(x) else np.empty((0, 4))
+    levels = []
+    while True:
+        starts = np.arange(0, len(boxes), node_size)
+        if not len(starts):
+            levels.append(np.empty((0, 4)))
+            break
+        packed = np.c_[np.minimum.reduceat(boxes[:, 0], starts),
+                       np.minimum.reduceat(boxes[:, 1], starts),
+                       np.maximum.reduceat(boxes[:, 2], starts),
+                       np.maximum.reduceat(boxes[:, 3], starts)]
+        levels.append(packed)
+        if len(packed) == 1:
+            break
+        boxes = packed
+    return levels
+
+
+# function to get the sorted row ids of the located rows in a bbox by
+# walking the packed r-tree from the root
+def query_rtree(store, bbox):
+
+    xmin, ymin, xmax, ymax = bbox
+    node_size = store['manifest']['node_size']
+    levels = store['levels']
+    nodes = np.arange(len(levels[-1]))
+    for k in range(len(levels) - 1, -1, -1):
+        boxes = levels[k][nodes]
+        hit = ((boxes[:, 0] <= xmax) & (boxes[:, 2] >= xmin)
+               & (boxes[:, 1] <= ymax) & (boxes[:, 3] >= ymin))
+        n_children = len(levels[k - 1]) if k else store['manifest']['located']
+        nodes = expand_ranges(nodes[hit] * node_size,
+                              np.minimum((nodes[hit] + 1) * node_size, n_children))
+    x, y = store['x'][nodes], store['y'][nodes]
+    inside = (x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)
+    return nodes[inside]
+
+
+# function to concatenate the integer ranges [starts[i], ends[i])
+def expand_ranges(starts, ends):
+
+    lengths = ends - starts
+    if not len(lengths) or not lengths.sum():
+        return np.array([], dtype=np.int64)
+    offsets = np.repeat(starts - np.r_[0, np.cumsum(lengths)[:-1]], lengths)
+    return np.arange(lengths.sum(), dtype=np.int64) + offsets
+
+
+# function to find the (start, end) positions of key ranges in a sorted
+# secondary index; returns the position ranges, the key ranges as
+# index keys, and the number of rows they hold
+def index_ranges(store, name, bounds):
+
+    keys = store['indexes'][name][0]
+    column = store['manifest']['columns'][name]
+    if column['kind'] == 'dictionary':
+        labels = {label: code for code, label in enumerate(column['labels'])}
+        bounds = [(labels[low], labels[high]) for low, high in bounds
+                  if low in labels and high in labels]
+    positions = [(np.searchsorted(keys, low, 'left'), np.searchsorted(keys, high, 'right'))
+                 for low, high in bounds]
+    return positions, bounds, sum(b - a for a, b in positions)
+
+
+# function to write one column as .npy files; returns its manifest entry
+# ('kind', dtype, and dictionary labels); nulls are kept in a mask
+def write_column(series, prefix, dictionary=False):
+
+    missing = series.isna().to_numpy()
+    entry = {'file': os.path.basename(prefix), 'mask': bool(missing.any())}
+    if missing.any():
+        np.save(f'{prefix}.mask.npy', missing)
+    if pd.api.types.is_bool_dtype(series) and not missing.any():
+        entry.update(kind='bool')
+        values = series.to_numpy(dtype=bool)
+    elif pd.api.types.is_integer_dtype(series):
+        entry.update(kind='int')
+        values = series.to_numpy(dtype=np.int64, na_value=0)
+    elif pd.api.types.is_numeric_dtype(series):
+        entry.update(kind='float')
+        values = series.to_numpy(dtype=float, na_value=np.nan)
+    else:
+        text = series.astype(object).where(~missing, None)
+        n_unique = text.nunique()
+        if dictionary or n_unique <= max(DICTIONARY_SHARE * len(text), 256):
+            codes, labels = pd.factorize(text.astype(str).where(~missing, None), sort=True)
+            entry.update(kind='dictionary', labels=labels.tolist())
+            values = codes.astype(np.int32)
+        else:
+            entry.update(kind='bytes')
+            values = np.array([s.encode('utf-8') if s is not None else b''
+                               for s in text.astype(str).where(~missing, None)])
+    np.save(f'{prefix}.npy', values)
+    return entry
+
+
+# function to get a column's sortable keys (dictionary codes or values)
+# and the rows where they are not null
+def column_keys(series, entry):
+
+    if entry['kind'] == 'dictionary':
+        codes = pd.factorize(series.astype(str).where(series.notna(), None), sort=True)[0]
+        return codes.astype(np.int32), codes >= 0
+    values = series.to_numpy(dtype=float, na_value=np.nan)
+    return values, ~np.isnan(values)
+
+
+# function to read the secondary index keys of a column at some rows
+def read_keys(store, name, rows):
+
+    entry = store['manifest']['columns'][name]
+    values = load_array(store, entry['file'] + '.npy')[rows]
+    valid = np.ones(len(rows), dtype=bool)
+    if entry['mask']:
+        valid = ~load_array(store, entry['file'] + '.mask.npy')[rows]
+    if entry['kind'] == 'dictionary':
+        valid &= values >= 0
+    return values, valid
+
+
+# function to read a column at some rows into a series
+def read_column(store, name, rows):
+
+    entry = store['manifest']['columns'][name]
+    values = load_array(store, entry['file'] + '.npy')[rows]
+    mask = np.zeros(len(rows), dtype=bool)
+    if entry['mask']:
+        mask = load_array(store, entry['file'] + '.mask.npy')[rows]
+    if entry['kind'] == 'int':
+        return pd.Series(pd.arrays.IntegerArray(values.astype(np.int64), mask), name=name)
+    if entry['kind'] == 'float':
+        return pd.Series(values, name=name)
+    if entry['kind'] == 'bool':
+        return pd.Series(values, name=name)
+    if entry['kind'] == 'dictionary':
+        labels = np.array(entry['labels'] + [None], dtype=object)
+        return pd.Series(labels[values], name=name)
+    text = np.array([v.decode('utf-8') for v in values], dtype=object)
+    text[mask] = None
+    return pd.Series(text, name=name)
+
+
+# function to reduce (cell, covers) pairs per cell with sorted-segment
+# reductions; returns the sorted unique cells and a dictionary of
+# 'plot_count' and per-column 'count', 'mean', 'median' and 'std' arrays
+def grid_statistics(cells, values):
+
+    if not len(cells):
+        empty = np.empty((0, values.shape[1]))
+        return cells, {'plot_count': np.empty(0), 'count': empty, 'mean': empty,
+                       'median': empty, 'std': empty}
+    order = np.argsort(cells, kind='stable')
+    cells, values = cells[order], values[order].astype(np.float64)
+    starts = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]])
+    plots = np.diff(np.r_[starts, len(cells)])
+    present = ~np.isnan(values)
+
+    # count, mean and (two-pass) sample standard deviation
+    count = np.add.reduceat(present, starts, axis=0).astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.add.reduceat(np.where(present, values, 0), starts, axis=0) / count
+        deviation = np.where(present, values - np.repeat(mean, plots, axis=0), 0)
+        std = np.sqrt(np.add.reduceat(deviation ** 2, starts, axis=0) / (count - 1))
+    std[count < 2] = np.nan
+
+    # medians from values sorted within each cell (nan last)
+    segment = np.repeat(np.arange(len(starts)), plots)
+    median = np.full(count.shape, np.nan)
+    for j in range(values.shape[1]):
+        ordered = values[np.lexsort((values[:, j], segment)), j]
+        n = count[:, j].astype(np.int64)
+        has = n > 0
+        low = ordered[(starts + (n - 1) // 2)[has]]
+        high = ordered[(starts + n // 2)[has]]
+        median[has, j] = (low + high) / 2
+    return cells[starts], {'plot_count': plots, 'count': count, 'mean': mean,
+                           'median': median, 'std': std}
+
+
+# function to memory-map a store array once per store
+def load_array(store, name):
+
+    arrays = store.setdefault('arrays', {})
+    if name not in arrays:
+        arrays[name] = np.load(os.path.join(store['dir'], name), mmap_mode='r')
+    return arrays[name]
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Build and query the indexed PAVC '
+                                                 'plot store.')
+    parser.add_argument('--store', default=os.path.join(ROOT, 'etc', 'cache', 'plot_store'),
+                        help='store directory')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='build the store from the synthesized tables')
+    build.add_argument('--pft', default=os.path.join(ROOT, 'synthesized_pft_fcover.csv'))
+    build.add_argument('--info', default=os.path.join(ROOT, 'survey_unit_information.csv'))
+    build.add_argument('--rebuild', action='store_true',
+                       help='rebuild even if the inputs did not change')
+    query = commands.add_parser('query', help='query the store')
+    query.add_argument('--bbox', nargs=4, type=float,
+                       metavar=('MINLON', 'MINLAT', 'MAXLON', 'MAXLAT'))
+    query.add_argument('--polygon', help='polygon as WKT (longitude/latitude)')
+    query.add_argument('--years', nargs=2, type=int, metavar=('FIRST', 'LAST'))
+    query.add_argument('--months', nargs=2, type=int, metavar=('FIRST', 'LAST'))
+    query.add_argument('--subzones', nargs='+', type=int)
+    query.add_argument('--sources', nargs='+')
+    query.add_argument('--min', nargs='+', default=[], metavar='COLUMN=VALUE',
+                       help='minimum PFT cover, e.g. lichen_cover=20')
+    query.add_argument('--max', nargs='+', default=[], metavar='COLUMN=VALUE',
+                       help='maximum PFT cover')
+    query.add_argument('--columns', nargs='+')
+    query.add_argument('-o', '--output', help='csv to write the plots to')
+    grid = commands.add_parser('grid', help='grid PFT cover statistics to a GeoTIFF')
+    grid.add_argument('output', help='GeoTIFF to write')
+    grid.add_argument('--resolution', type=float, default=1000,
+                      help='cell size in units of --epsg')
+    grid.add_argument('--epsg', default='EPSG:5936', help='projected CRS of the grid')
+    grid.add_argument('--columns', nargs='+', help='cover columns (default all)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        build_store(args.pft, args.info, args.store, rebuild=args.rebuild)
+        print(f'built {args.store}')
+        return 0
+
+    store = open_store(args.store)
+    if args.command == 'grid':
+        names = grid_pft_cover(store, args.output, resolution=args.resolution,
+                               epsg=args.epsg, columns=args.columns)
+        print(f'{len(names)} bands written to {args.output}')
+        return 0
+
+    pft = {}
+    for bound, items in [(0, args.min), (1, args.max)]:
+        for item in items:
+            name, value = item.split('=')
+            pft.setdefault(name, [None, None])[bound] = float(value)
+    plots = query_plots(store, bbox=args.bbox, polygon=args.polygon, years=args.years,
+                        months=args.months, subzones=args.subzones, sources=args.sources,
+                        pft={name: tuple(b) for name, b in pft.items()} or None,
+                        columns=args.columns)
+    if args.output:
+        plots.to_csv(args.output, encoding='utf-8-sig')
+    print(f'{len(plots)} plots' + (f' written to {args.output}' if args.output else ''))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
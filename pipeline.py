@@ -0,0 +1,700 @@
+"""
+Declarative per-source standardization pipeline.
+
+Runs the stages that every `standardize_{source}.ipynb` notebook repeats
+(species loading, checklist join, leaf retention, habit export, habit
+standardization, PFT aggregation, plot information, geospatial overlay,
+duplicate flags, export to the output store and validation) from a small
+JSON config per source (`{source}/pipeline.json`). Paths in a config are
+relative to the config's directory, just like the paths in the notebooks.
+
+Each stage's output is memoized on disk, keyed by a hash of the stage's
+config entries, the contents of the files it reads, the keys of the
+stages it depends on, and the code (this script and
+`standardize_pft_funcs`). A rerun only executes the stages whose key
+changed, e.g. editing a source's aux config reruns 'aux' and the stages
+after it, but not the species and habit stages.
+
+The manual habit review is kept: the 'habits' stage exports the habit
+files for review, and 'standard_habits' reads the cleaned files
+(`habit_paths`); until these exist the source stops after 'habits'.
+
+Usage:
+    python pipeline.py                    # every source with a pipeline.json
+    python pipeline.py abr nga --jobs 2   # sources in parallel processes
+    python pipeline.py akveg --dry-run    # show the stages that would run
+    python pipeline.py akveg --force aux  # rerun aux and the stages after it
+    python pipeline.py abr --trace traces # write traces/abr.trace.json
+"""
+
+import argparse
+import contextlib
+import glob
+import hashlib
+import json
+import os
+import pickle
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import standardize_pft_funcs as spf
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# standard PFT names and their exported cover column names
+PFT_COLUMNS = {'deciduous shrub': 'deciduousShrubCover',
+               'evergreen shrub': 'evergreenShrubCover',
+               'deciduous tree': 'deciduousTreeCover',
+               'evergreen tree': 'evergreenTreeCover',
+               'forb': 'forbCover',
+               'graminoid': 'graminoidCover',
+               'non-vascular': 'nonvascularSumCover',
+               'bryophyte': 'bryophyteCover',
+               'lichen': 'lichenCover',
+               'litter': 'litterCover',
+               'bare ground': 'baregroundCover',
+               'water': 'waterCover',
+               'other': 'otherCover'}
+
+
+##########################################################################################
+# Stages: function(config, *outputs of the stages it depends on)
+##########################################################################################
+
+def load_species(config):
+
+    """
+    Stage that loads the species-level observations of a source as a long
+    dataframe with 'plotName', 'datasetSpeciesName' and 'percentCover'
+    columns; empty and zero covers are dropped.
+
+    config (dict): source config; 'species' is either
+                   {'type': 'cover_tables', 'pattern': ...} for wide cover
+                   tables (see `spf.read_ava_cover_tables`), with optional
+                   'cover_codes' ({fcoverScale: {code: percent cover}} for
+                   tables with ordinal cover codes), or
+                   {'type': 'csv', 'path': ..., 'columns': {...}} for a long
+                   table, with optional 'fallbacks' ({column: column used
+                   where the first is missing}, applied before renaming);
+                   both take optional 'strip_chars' (characters stripped
+                   from the species names), 'plot_regex' (regex plot names
+                   must match) and 'zero_cover' (cover assigned to 0, i.e. trace)
+    """
+
+    params = config['species']
+    if params['type'] == 'cover_tables':
+        species = spf.read_ava_cover_tables(sorted(glob.glob(params['pattern'])))
+        cover = species['cover']
+        for scale, codes in params.get('cover_codes', {}).items():
+            rows = species['fcoverScale'] == scale
+            cover = cover.mask(rows, cover[rows].replace(codes))
+        species['percentCover'] = pd.to_numeric(cover, errors='coerce')
+    elif params['type'] == 'csv':
+        species = pd.read_csv(params['path'])
+        for column, fallback in params.get('fallbacks', {}).items():
+            species[column] = species[column].combine_first(species[fallback])
+        species = species.rename(columns=params['columns'])
+    else:
+        raise ValueError(f"unknown species loader type {params['type']!r}")
+
+    species = species[['plotName', 'datasetSpeciesName', 'percentCover']]
+    if params.get('strip_chars'):
+        names = species['datasetSpeciesName'].str.strip(params['strip_chars']).str.strip()
+        species = species.assign(datasetSpeciesName=names.replace('', np.nan))
+    species = species[species['datasetSpeciesName'].notna()]
+    if params.get('plot_regex'):
+        match = species['plotName'].astype(str).str.match(params['plot_regex'])
+        species = species[match]
+    if params.get('zero_cover') is not None:
+        species['percentCover'] = species['percentCover'].replace(0, params['zero_cover'])
+    keep = species['percentCover'].notna() & (species['percentCover'] != 0)
+    return species[keep].reset_index(drop=True)
+
+
+def join_habits(config, species):
+
+    """
+    Stage that joins the unique species names to the AKVEG checklist and
+    the leaf retention table, and exports the shrub, non-shrub and null
+    habit files for manual review (see `spf.export_habit_files`), along
+    with fuzzy checklist matches for the null habits (see `spf.match_names`).
+
+    config     (dict): source config with 'checklist_path', 'leaf_retention_path',
+                       'habit_dir' and 'cache_dir'
+    species (dataframe): output of `load_species`
+    """
+
+    names = pd.DataFrame({'datasetSpeciesName': species['datasetSpeciesName'].unique()})
+    names['joinKey'] = spf.get_substring_keys(names['datasetSpeciesName'])
+    checklist_df, checklist_lookup = spf.cached_checklist(config['checklist_path'],
+                                                          config['cache_dir'])
+    habits = spf.join_to_checklist(unique_species=names,
+                                   checklist=checklist_df,
+                                   u_name='datasetSpeciesName',
+                                   c_unofficial_name='checklistSpeciesName',
+                                   c_official_name='nameAccepted',
+                                   mapping_name='joinKey',
+                                   habit='speciesHabit',
+                                   compiled=checklist_lookup)
+    habits = names.merge(habits, how='left', on='datasetSpeciesName', suffixes=(None, '_1'))
+    habits = habits[['joinKey', 'datasetSpeciesName', 'speciesHabit']]
+
+    # leaf retention and simplified shrub habits
+    leaf_df = spf.leaf_retention_df(config['leaf_retention_path'])
+    habits_wleaf = spf.add_leaf_retention(habits, leaf_df, 'leafRetention')
+    habits_wleaf = habits_wleaf[['datasetSpeciesName', 'joinKey', 'speciesHabit',
+                                 'leafRetention']]
+    habits_wleaf['speciesHabit'] = spf.clean_shrub_habit_names(habits_wleaf['speciesHabit'])
+
+    os.makedirs(config['habit_dir'], exist_ok=True)
+    source = config['source']
+    _, _, null = spf.export_habit_files(habits_wleaf, config['habit_dir'], source,
+                                        'speciesHabit')
+
+    # ranked checklist names for the species without a habit
+    name_index = spf.cached_name_index(config['checklist_path'], config['cache_dir'])
+    null_candidates = spf.match_names(null['datasetSpeciesName'], name_index)
+    null_candidates.to_csv(os.path.join(config['habit_dir'], f'{source}_nullhabit_candidates.csv'),
+                           index=False, encoding='utf-8-sig')
+    return habits_wleaf
+
+
+def standardize_habits(config):
+
+    """
+    Stage that reads the manually cleaned habit files and assigns the
+    standard PFT of every species (see `spf.standardize_habits`).
+
+    config (dict): source config with 'habit_paths'
+    """
+
+    missing = [path for path in config['habit_paths'] if not os.path.exists(path)]
+    if missing:
+        raise FileNotFoundError(f'clean the exported habit files and save them as {missing}')
+    all_habits = pd.concat([pd.read_csv(path, index_col=0) for path in config['habit_paths']])
+    all_habits['standardHabit'] = spf.standardize_habits(all_habits['speciesHabit'],
+                                                        all_habits['leafRetention'],
+                                                        config['source'])
+    all_habits = all_habits.rename(columns={'speciesHabit': 'nonstandardHabit'})
+    return all_habits[['datasetSpeciesName', 'standardHabit', 'nonstandardHabit']]
+
+
+def build_species_fcover(config, species, all_habits):
+
+    """
+    Stage that adds the standard and nonstandard habits to the species
+    observations.
+
+    config          (dict): source config with optional 'habit_replacements'
+    species    (dataframe): output of `load_species`
+    all_habits (dataframe): output of `standardize_habits`
+    """
+
+    species_fcover = species.merge(all_habits, on='datasetSpeciesName')
+    species_fcover['standardHabit'] = (species_fcover['standardHabit']
+                                       .replace(config.get('habit_replacements', {})))
+    return species_fcover[['plotName', 'datasetSpeciesName', 'standardHabit',
+                           'nonstandardHabit', 'percentCover']]
+
+
+def build_pft_fcover(config, species_fcover):
+
+    """
+    Stage that sums species fcover per plot and PFT and adds the source's
+    non-vegetation (top) cover.
+
+    config          (dict): source config with 'pfts' and optional 'drop_pfts'
+                            (PFTs to drop from the species sums) and 'nonveg'
+                            ({'path', 'index', 'columns'}; columns renamed to
+                            the same PFT are summed; also takes the table
+                            options of the aux 'tables')
+    species_fcover (dataframe): output of `build_species_fcover`
+    """
+
+    pft_fcover = spf.aggregate_pft_cover(species_fcover)
+    pft_fcover.columns.name = None
+    pft_fcover.index.name = 'plotName'
+    pft_fcover.index = pft_fcover.index.astype(str)
+    pft_fcover = pft_fcover.drop(columns=config.get('drop_pfts', []), errors='ignore')
+    pft_fcover = spf.add_standard_cols(pft_fcover, config['pfts'])[config['pfts']]
+
+    nonveg_params = config.get('nonveg')
+    if nonveg_params:
+        nonveg = read_table(nonveg_params)
+        nonveg = nonveg.set_index(nonveg_params['index'])[list(nonveg_params['columns'])]
+        nonveg = nonveg.apply(pd.to_numeric, errors='coerce')
+        nonveg = nonveg.rename(columns=nonveg_params['columns'])
+        nonveg = nonveg.T.groupby(level=0, sort=False).sum().T
+        nonveg.index = nonveg.index.astype(str)
+        pft_fcover = pft_fcover.merge(nonveg, how='left', left_index=True, right_index=True)
+    return pft_fcover
+
+
+def build_aux(config):
+
+    """
+    Stage that builds the basic plot information from the source's
+    ancillary tables.
+
+    config (dict): source config with 'methods_path', 'epsg' (of the
+                   coordinates) and 'aux':
+                   'tables'  list of {'path', 'key'} merged (left) in order,
+                             with optional 'first' (keep the first row per key),
+                             'read_csv' (keyword arguments), 'skip_rows' (rows
+                             dropped below the header) and 'na_values' (values
+                             replaced with null); tables that are not .csv
+                             (e.g. .xlsx) are read with pyogrio, with optional
+                             'read_dataframe' (keyword arguments, e.g. GDAL
+                             open options like {'HEADERS': 'FORCE'})
+                   'dropna'  drop rows with any missing value
+                   'date'    column with survey dates; 'date_format' is
+                             'integer' for yyyymmdd numbers (see
+                             `spf.parse_int_dates`), otherwise mixed
+                   'plot_dimensions' column like '5 radius' or '10x10', or
+                   'plot_radius'     radius in m (a column name or a number), or
+                   'plot_area'       area in m2 (a column name) along with a
+                                     'plot_shape' column; areas that are not
+                                     numbers leave both columns null
+                   'columns' ordered {name: {'column', 'dtype'} or {'value'}};
+                             a column can be edited with 'sub' ({regex:
+                             replacement}, then stripped), 'contains'
+                             ({substring: value}, null if none is found) and
+                             'replace' ({value: value})
+                   'min_year'  drop plots surveyed before this year
+                   'clip_path' polygons outside of which plots are dropped
+    """
+
+    params = config['aux']
+    aux = None
+    for table in params['tables']:
+        df = read_table(table)
+        if table.get('first'):
+            df = df.groupby(table['key'], as_index=False).first()
+        aux = df if aux is None else aux.merge(df, how='left', on=table['key'])
+    if params.get('dropna'):
+        aux = aux.dropna()
+    aux = aux.reset_index(drop=True)
+
+    # date columns
+    new_aux = pd.DataFrame(index=aux.index)
+    if params.get('date_format') == 'integer':
+        dates = spf.parse_int_dates(aux[params['date']])
+        new_aux[['surveyYear', 'surveyMonth', 'surveyDay']] = dates[['surveyYear', 'surveyMonth',
+                                                                     'surveyDay']]
+    else:
+        survey_date = pd.to_datetime(aux[params['date']], format='mixed')
+        new_aux['surveyYear'] = survey_date.dt.year
+        new_aux['surveyMonth'] = survey_date.dt.month
+        new_aux['surveyDay'] = survey_date.dt.day
+
+    # plot size
+    if params.get('plot_dimensions'):
+        dims = spf.parse_plot_dimensions(aux[params['plot_dimensions']])
+        new_aux[['plotArea', 'plotShape']] = dims[['plotArea', 'plotShape']]
+    elif params.get('plot_radius') is not None:
+        radius = params['plot_radius']
+        if isinstance(radius, str):
+            radius = pd.to_numeric(aux[radius], errors='coerce')
+        new_aux['plotArea'] = np.pi * radius**2
+        new_aux['plotShape'] = 'circle'
+    elif params.get('plot_area'):
+        area = pd.to_numeric(aux[params['plot_area']], errors='coerce')
+        valid = area.notna() | aux[params['plot_area']].isna()
+        new_aux['plotArea'] = area
+        new_aux['plotShape'] = aux[params['plot_shape']].where(valid)
+
+    # copied and constant columns
+    for name, spec in params['columns'].items():
+        if 'value' in spec:
+            new_aux[name] = spec['value']
+        else:
+            new_aux[name] = column_values(aux[spec['column']], spec)
+
+    # plots outside of the study period or area
+    if params.get('min_year') is not None:
+        new_aux = new_aux[new_aux['surveyYear'].fillna(0) >= params['min_year']]
+    if params.get('clip_path'):
+        import geopandas as gpd
+        area = gpd.read_file(params['clip_path'])
+        points = gpd.GeoSeries(gpd.points_from_xy(new_aux['longitudeX'], new_aux['latitudeY']),
+                               index=new_aux.index, crs=config['epsg'])
+        new_aux = new_aux[points.to_crs(area.crs).intersects(area.union_all())]
+
+    methods = pd.read_csv(config['methods_path'])
+    new_aux = new_aux.merge(methods, how='left', on='dataSubsource')
+    new_aux['plotName'] = new_aux['plotName'].astype(str)
+    return new_aux.set_index(new_aux['plotName'])
+
+
+def add_geospatial(config, pft_fcover, new_aux):
+
+    """
+    Stage that joins PFT fcover and plot information and adds the
+    geospatial layer intersections (see `spf.add_geospatial_aux`).
+
+    config          (dict): source config with 'epsg' (of the coordinates),
+                            'layers' (list of {'path', 'name', 'columns'}),
+                            'layer_columns' (renames), 'cache_dir', and
+                            optional 'intersect_epsg' and 'geo_jobs'
+    pft_fcover (dataframe): output of `build_pft_fcover`
+    new_aux    (dataframe): output of `build_aux`
+    """
+
+    import geopandas as gpd
+    intersect_epsg = config.get('intersect_epsg', 'EPSG:5936')
+    new_aux = new_aux.drop(columns='plotName')
+    fcover_and_aux = pd.concat([pft_fcover, new_aux], join='inner', axis=1)
+    fcover_and_aux = gpd.GeoDataFrame(fcover_and_aux,
+                                      geometry=gpd.points_from_xy(fcover_and_aux['longitudeX'],
+                                                                  fcover_and_aux['latitudeY']),
+                                      crs=config['epsg'])
+    fcover_and_aux = fcover_and_aux.to_crs(intersect_epsg)
+
+    layers = config['layers']
+    fcover_and_aux = spf.add_geospatial_aux(fcover_and_aux,
+                                            [layer['path'] for layer in layers],
+                                            [layer['name'] for layer in layers],
+                                            [layer['columns'] for layer in layers],
+                                            intersect_epsg,
+                                            cache_dir=config['cache_dir'],
+                                            n_jobs=config.get('geo_jobs'))
+    drop = [f"index_{layer['name']}" for layer in layers]
+    fcover_and_aux = fcover_and_aux.drop(columns=drop, errors='ignore')
+    return fcover_and_aux.rename(columns=config.get('layer_columns', {}))
+
+
+def flag_duplicates(config, fcover_and_aux):
+
+    """
+    Stage that flags plots with duplicated coordinates and survey dates
+    (see `spf.find_duplicates`).
+
+    config              (dict): source config (unused)
+    fcover_and_aux (dataframe): output of `add_geospatial`
+    """
+
+    coords = ['longitudeX', 'latitudeY']
+    date = ['surveyYear', 'surveyMonth', 'surveyDay']
+    fcover_and_aux = fcover_and_aux.copy()
+    fcover_and_aux['duplicatedCoords'] = np.nan
+    fcover_and_aux['duplicatedDate'] = np.nan
+    return spf.find_duplicates(fcover_and_aux, [coords, date],
+                               ['duplicatedCoords', 'duplicatedDate'])
+
+
+def export_store(config, species_fcover, fcover_and_aux):
+
+    """
+    Stage that writes the source's species fcover, PFT fcover and plot
+    information to the output store (see `spf.write_store_table`).
+    Returns the paths to the written files.
+
+    config              (dict): source config with 'store_dir'
+    species_fcover (dataframe): output of `build_species_fcover`
+    fcover_and_aux (dataframe): output of `flag_duplicates`
+    """
+
+    # rename columns and replace NaN cover with 0
+    fcover_and_aux = fcover_and_aux.rename(columns=PFT_COLUMNS)
+    fcover_cols = [col for col in PFT_COLUMNS.values() if col in fcover_and_aux.columns]
+    fcover_and_aux[fcover_cols] = fcover_and_aux[fcover_cols].fillna(0.0)
+
+    # reproject and set cover data type
+    fcover_and_aux = fcover_and_aux.to_crs('EPSG:4326')
+    fcover_and_aux[fcover_cols] = fcover_and_aux[fcover_cols].astype(np.float32)
+    fcover_and_aux.index.name = 'plotName'
+
+    source, store_dir = config['source'], config['store_dir']
+    covercols = [col for col in fcover_and_aux.columns if 'Cover' in col]
+    auxcols = [col for col in fcover_and_aux.columns if 'Cover' not in col]
+    return [spf.write_store_table(species_fcover, store_dir, 'nonstandard_species_fcover', source),
+            spf.write_store_table(fcover_and_aux[covercols], store_dir, 'standard_pft_fcover',
+                                  source),
+            spf.write_store_table(fcover_and_aux[auxcols], store_dir, 'plot_info', source)]
+
+
+def validate_export(config, paths):
+
+    """
+    Stage that checks the source's exported tables against the cover and
+    plot information rules (see `spf.validate_store_table`) and prints the
+    number of violations per rule. Returns the violations of all tables
+    with a 'table' column.
+
+    config (dict): source config with 'store_dir'
+    paths  (list): output of `export_store`
+    """
+
+    source, store_dir = config['source'], config['store_dir']
+    violations = []
+    for table in ['nonstandard_species_fcover', 'standard_pft_fcover', 'plot_info']:
+        table_violations = spf.validate_store_table(store_dir, table, sources=[source])
+        table_violations.insert(0, 'table', table)
+        violations.append(table_violations)
+    violations = pd.concat(violations, ignore_index=True)
+    counts = violations['code'].value_counts()
+    for code, count in counts[counts > 0].items():
+        print(f'[{source}] validate: {count} rows violate {code}', flush=True)
+    return violations
+
+
+# function to read a source table (see the aux 'tables' in `build_aux`)
+def read_table(table):
+
+    if table['path'].lower().endswith('.csv'):
+        df = pd.read_csv(table['path'], **table.get('read_csv', {}))
+    else:
+        from pyogrio import read_dataframe
+        df = pd.DataFrame(read_dataframe(table['path'], read_geometry=False,
+                                         **table.get('read_dataframe', {})))
+    df = df.iloc[table.get('skip_rows', 0):]
+    if table.get('na_values'):
+        df = df.replace(table['na_values'], np.nan)
+    return df
+
+
+# function to copy an aux column and apply the edits of its spec
+# (see the aux 'columns' in `build_aux`)
+def column_values(values, spec):
+
+    for pattern, replacement in spec.get('sub', {}).items():
+        values = values.str.replace(pattern, replacement, regex=True)
+    if spec.get('sub'):
+        values = values.str.strip()
+    if spec.get('contains'):
+        found = [values.str.contains(key, regex=False, na=False) for key in spec['contains']]
+        values = pd.Series(np.select(found, list(spec['contains'].values()), None),
+                           index=values.index)
+    if spec.get('replace'):
+        values = values.replace(spec['replace'])
+    if spec.get('dtype'):
+        values = values.astype(spec['dtype'])
+    return values
+
+
+# stage name: (function, stages it depends on, config entries it reads,
+#              whether its output is a list of written files)
+STAGES = {'species': (load_species, [], ['species'], False),
+          'habits': (join_habits, ['species'],
+                     ['checklist_path', 'leaf_retention_path', 'habit_dir'], False),
+          'standard_habits': (standardize_habits, [], ['habit_paths'], False),
+          'species_fcover': (build_species_fcover, ['species', 'standard_habits'],
+                             ['habit_replacements'], False),
+          'pft_fcover': (build_pft_fcover, ['species_fcover'],
+                         ['pfts', 'drop_pfts', 'nonveg'], False),
+          'aux': (build_aux, [], ['aux', 'methods_path', 'epsg'], False),
+          'geospatial': (add_geospatial, ['pft_fcover', 'aux'],
+                         ['epsg', 'intersect_epsg', 'layers', 'layer_columns'], False),
+          'duplicates': (flag_duplicates, ['geospatial'], [], False),
+          'export': (export_store, ['species_fcover', 'duplicates'], ['store_dir'], True),
+          'validate': (validate_export, ['export'], [], False)}
+
+
+##########################################################################################
+# Runner functions
+##########################################################################################
+
+def run_source(config_path, store_dir='output_store', cache_dir=None, force=(),
+               dry_run=False, trace_dir=None):
+
+    """
+    Main function that runs the pipeline of one source. Stages whose key
+    (see `stage_keys`) has a memoized output are skipped; their outputs
+    are only loaded when a later stage has to run. Returns a list of
+    (stage, status) pairs with status 'cached', 'ran' or 'pending'
+    (for a dry run), or 'missing inputs' for the stage the source stopped at.
+
+    config_path (string): path to the source's pipeline.json
+    store_dir   (string): path to the output store (relative to the repo)
+    cache_dir   (string): directory of the memoized stage outputs
+                          (default etc/cache/pipeline)
+    force         (list): stages to rerun, along with every stage after them
+    dry_run       (bool): only report the stages that would run
+    trace_dir   (string): optional directory to write a Chrome trace of the
+                          stages and `spf` functions that ran to
+                          (`{source}.trace.json`, see `spf.instrument`)
+    """
+
+    raw, config = load_config(config_path, store_dir)
+    source = config['source']
+    cache_dir = os.path.join(cache_dir or os.path.join(ROOT, 'etc', 'cache', 'pipeline'), source)
+    os.makedirs(cache_dir, exist_ok=True)
+    keys = stage_keys(raw, config)
+
+    outputs, statuses, invalid = {}, [], set()
+    def output(stage):
+        if stage not in outputs:
+            with open(stage_path(cache_dir, stage, keys[stage]), 'rb') as file:
+                outputs[stage] = pickle.load(file)
+        return outputs[stage]
+
+    tracing = spf.instrument() if trace_dir and not dry_run else contextlib.nullcontext([])
+    with tracing as events:
+        for stage, (func, deps, _, writes) in STAGES.items():
+            path = stage_path(cache_dir, stage, keys[stage])
+            if stage in force or invalid & set(deps):
+                invalid.add(stage)
+            if stage not in invalid and os.path.exists(path):
+                if not writes or all(os.path.exists(p) for p in output(stage)):
+                    statuses.append((stage, 'cached'))
+                    continue
+            invalid.add(stage)
+            if dry_run:
+                statuses.append((stage, 'pending'))
+                continue
+
+            # run the stage and memoize its output atomically; a source whose
+            # inputs are not there yet (e.g. unreviewed habit files) stops here
+            start = time.perf_counter()
+            try:
+                with spf.span(stage, source=source):
+                    outputs[stage] = func(config, *[output(dep) for dep in deps])
+            except FileNotFoundError as error:
+                print(f'[{source}] {stage} stopped: {error}', flush=True)
+                statuses.append((stage, 'missing inputs'))
+                break
+            with open(path + '.tmp', 'wb') as file:
+                pickle.dump(outputs[stage], file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(path + '.tmp', path)
+            for old in glob.glob(os.path.join(glob.escape(cache_dir), f'{stage}-*.pkl')):
+                if old != path:
+                    os.remove(old)
+            print(f'[{source}] {stage} ran in {time.perf_counter() - start:.1f} s', flush=True)
+            statuses.append((stage, 'ran'))
+    if events:
+        os.makedirs(trace_dir, exist_ok=True)
+        spf.write_trace(events, os.path.join(trace_dir, f'{source}.trace.json'))
+    return statuses
+
+
+def run_sources(config_paths, jobs=1, **kwargs):
+
+    """
+    Main function that runs the pipelines of several (independent)
+    sources, in `jobs` worker processes if jobs > 1. Returns a dictionary
+    of source config path to the statuses returned by `run_source`.
+
+    config_paths (list): paths to the sources' pipeline.json
+    jobs          (int): number of worker processes
+    kwargs       (dict): keyword arguments passed to `run_source`
+    """
+
+    if jobs > 1 and len(config_paths) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(config_paths))) as pool:
+            futures = {path: pool.submit(run_source, path, **kwargs) for path in config_paths}
+            return {path: future.result() for path, future in futures.items()}
+    return {path: run_source(path, **kwargs) for path in config_paths}
+
+
+# function to read a source config; returns the config as written (used
+# for the stage keys) and a copy with paths made absolute
+def load_config(config_path, store_dir):
+
+    with open(config_path) as file:
+        raw = json.load(file)
+    raw.setdefault('store_dir', store_dir)
+    raw.setdefault('cache_dir', os.path.join('..', 'etc', 'cache'))
+    base = os.path.dirname(os.path.abspath(config_path))
+    config = resolve_paths(raw, base)
+    config['store_dir'] = os.path.join(ROOT, raw['store_dir'])
+    return raw, config
+
+
+# function to make every path in a config absolute (entries whose name
+# ends with 'path', 'paths', 'pattern' or 'dir')
+def resolve_paths(value, base, key=''):
+
+    if isinstance(value, dict):
+        return {k: resolve_paths(v, base, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [resolve_paths(v, base, key) for v in value]
+    if isinstance(value, str) and key.endswith(('path', 'paths', 'pattern', 'dir')):
+        return os.path.normpath(os.path.join(base, value))
+    return value
+
+
+# function to hash every file a (resolved) config entry refers to;
+# missing files hash as None so the stage reruns once they appear
+def input_hashes(value, key=''):
+
+    hashes = {}
+    if isinstance(value, dict):
+        for k, v in value.items():
+            hashes.update(input_hashes(v, k))
+    elif isinstance(value, list):
+        for v in value:
+            hashes.update(input_hashes(v, key))
+    elif isinstance(value, str) and key.endswith('pattern'):
+        for path in sorted(glob.glob(value)):
+            hashes[path] = spf.file_hash(path)
+        hashes[value] = len(hashes)
+    elif isinstance(value, str) and key.endswith(('path', 'paths')):
+        hashes[value] = spf.layer_hash(value) if os.path.exists(value) else None
+    return hashes
+
+
+# function to get the key of every stage from its config entries, input
+# files, code, and the keys of the stages it depends on
+def stage_keys(raw, config):
+
+    code = [spf.file_hash(spf.__file__), spf.file_hash(os.path.abspath(__file__))]
+    keys = {}
+    for stage, (_, deps, entries, _) in STAGES.items():
+        params = {entry: raw.get(entry) for entry in entries}
+        files = input_hashes({entry: config.get(entry) for entry in entries})
+        files = {os.path.relpath(path, ROOT): digest for path, digest in files.items()}
+        payload = {'stage': stage, 'source': raw['source'], 'params': params,
+                   'files': files, 'deps': [keys[dep] for dep in deps], 'code': code}
+        text = json.dumps(payload, sort_keys=True, default=str)
+        keys[stage] = hashlib.sha256(text.encode()).hexdigest()
+    return keys
+
+
+# function to get the path of a memoized stage output
+def stage_path(cache_dir, stage, key):
+
+    return os.path.join(cache_dir, f'{stage}-{key[:16]}.pkl')
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Run the per-source standardization '
+                                                 'pipeline with memoized stages.')
+    parser.add_argument('sources', nargs='*',
+                        help='sources to run (default: every */pipeline.json)')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='number of sources processed in parallel')
+    parser.add_argument('--force', nargs='+', default=[], choices=list(STAGES),
+                        help='rerun these stages (and the stages after them)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only show which stages would run')
+    parser.add_argument('--store-dir', default='output_store',
+                        help='output store, relative to the repository')
+    parser.add_argument('--cache-dir', default=None,
+                        help='memoized stage outputs (default etc/cache/pipeline)')
+    parser.add_argument('--trace', default=None, metavar='DIR',
+                        help='write a Chrome trace of every source run to DIR')
+    args = parser.parse_args(argv)
+
+    if args.sources:
+        paths = [os.path.join(ROOT, source, 'pipeline.json') for source in args.sources]
+    else:
+        paths = sorted(glob.glob(os.path.join(ROOT, '*', 'pipeline.json')))
+    missing = [path for path in paths if not os.path.exists(path)]
+    if missing:
+        parser.error(f'no pipeline config: {missing}')
+
+    results = run_sources(paths, jobs=args.jobs, store_dir=args.store_dir,
+                          cache_dir=args.cache_dir, force=set(args.force),
+                          dry_run=args.dry_run, trace_dir=args.trace)
+    for path, statuses in results.items():
+        source = os.path.basename(os.path.dirname(path))
+        print(f'{source}: ' + ', '.join(f'{stage} {status}' for stage, status in statuses))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,18 +1,31 @@
-import requests
-import geopandas as gpd
 import pandas as pd
 import numpy as np
 from datetime import date, timedelta
-from pyogrio import read_dataframe
 import glob
-import geopandas as gpd
+import hashlib
+import tempfile
+import shutil
+import codecs
+import json
+import csv
+import sqlite3
+import time
+import sys
+import functools
+import threading
+import tracemalloc
+from contextlib import closing, contextmanager, nullcontext
 import os
-import standardize_pft_funcs as spf
-import chardet
-import tarfile
-from urllib.request import urlretrieve
-import regex as re
-from shapely.validation import make_valid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# geopandas, shapely, pyogrio, scipy, pyarrow, regex, requests and chardet
+# are imported in the functions that use them, so importing this module
+# (e.g. in batch jobs and worker processes) costs little more than
+# importing pandas
 
 """
 CAVEATS:
@@ -27,10 +40,170 @@ or dataframe are changed in anyway, there is no guarantee that these
 functions will remain usable!
 """
 
+__version__ = '1.0.0'
+
+# NEON named locations API used by `neon_locations`
+NEON_LOCATIONS_URL = 'http://data.neonscience.org/api/v0/locations/'
+
+# derived PFTs and the habits they sum; see `aggregate_pft_cover`
+DERIVED_PFTS = {'non-vascular': ['bryophyte', 'lichen']}
+
+# ordered (regex, PFT) rules used by `standardize_habits` to map checklist
+# habits to standard PFTs; '{leaf}' is filled with the leaf retention
+HABIT_RULES = [('algae', 'other'),
+               ('moss|liverwort', 'bryophyte'),
+               ('spore-bearing', 'forb'),
+               ('shrub', '{leaf} shrub'),
+               ('tree', '{leaf} tree')]
+
+# per-source rules that are tried before HABIT_RULES
+HABIT_RULE_OVERRIDES = {'abr': [('crust', 'other'),
+                                ('litter|scat', 'litter'),
+                                ('bare ground|mineral', 'bare ground')],
+                        'ava': [('cyanobacteria|crust|unknown', 'other'),
+                                ('grass', 'graminoid')],
+                        'neon': [('litter|scat', 'litter'),
+                                 ('rock|soil', 'bare ground')]}
+
+# fallback levels used to match species names to the akveg checklist,
+# in the order they are tried by `join_to_checklist`
+CHECKLIST_MATCH_LEVELS = ['accepted', 'synonym', 'genus', 'synonymGenus']
+
+# standard PFT cover columns of the exported 'standard_pft_fcover' tables
+COVER_COLUMNS = ['deciduousShrubCover', 'evergreenShrubCover', 'deciduousTreeCover',
+                 'evergreenTreeCover', 'forbCover', 'graminoidCover', 'nonvascularSumCover',
+                 'bryophyteCover', 'lichenCover', 'litterCover', 'baregroundCover',
+                 'waterCover', 'otherCover']
+
+# (code, check, columns, argument) rules evaluated by `validate_cover`;
+# rules whose columns are not in a table are skipped, and snake_case
+# (harmonized) column names match too. Checks:
+#   'range'    every value within (low, high); None is unbounded
+#   'sum'      the columns' sum compared ('==', '<=', '>=') to a column or number
+#   'trace'    values in [0, upper) must be one of the trace values
+#   'not_null' every value is present
+COVER_RULES = [('negative_cover', 'range', COVER_COLUMNS + ['percentCover'], (0, None)),
+               ('nonvascular_sum', 'sum', ['bryophyteCover', 'lichenCover'],
+                ('==', 'nonvascularSumCover')),
+               ('top_cover_sum', 'sum', ['baregroundCover', 'waterCover'], ('<=', 100)),
+               ('trace_value', 'trace', ['percentCover'], ((0.01, 0.05), 0.1)),
+               ('missing_value', 'not_null', ['latitudeY', 'longitudeX', 'surveyYear'], None),
+               ('latitude_range', 'range', ['latitudeY'], (-90, 90)),
+               ('longitude_range', 'range', ['longitudeX'], (-180, 180)),
+               ('survey_year', 'range', ['surveyYear'], (1900, date.today().year)),
+               ('survey_month', 'range', ['surveyMonth'], (1, 12)),
+               ('survey_day', 'range', ['surveyDay'], (1, 31))]
+
+##########################################################################################
+# Instrumentation: opt-in timing and memory events for the main functions
+##########################################################################################
+
+# active tracer set by `instrument` (None when instrumentation is off);
+# a dictionary with the event 'sink', 'trace_memory', the open 'stack',
+# and the 'thread' whose calls are traced
+TRACER = None
+
+
+@contextmanager
+def instrument(sink=None, trace_memory=False):
+
+    """
+    Main function (a context manager) that turns on instrumentation of
+    the main functions and their internal phases, e.g. every
+    `join_to_checklist` match level and every `add_geospatial_aux` layer.
+    Each finished function or phase emits one Chrome trace 'complete'
+    event (a dictionary with 'name', 'cat', 'ph', 'ts' and 'dur' in
+    microseconds, 'pid', 'tid', and 'args') to the sink. The args hold
+    the input and output row counts (when known), the process' peak RSS
+    (ru_maxrss), and, with trace_memory, the peak tracemalloc memory
+    above the start of the phase. Yields the list of events when no sink
+    is given; see `write_trace`. Only calls on the thread that turned
+    instrumentation on are traced, as the open spans and tracemalloc
+    peaks are shared by the whole process; calls in worker threads (e.g.
+    the requests of `neon_locations`) are not. With instrumentation off,
+    the instrumented functions only check `TRACER`.
+
+    e.g. with spf.instrument() as events:
+             habits = spf.join_to_checklist(...)
+         spf.write_trace(events, 'trace.json')
+
+    sink       (callable): optional function called with every event,
+                           e.g. `json_lines_sink(path)`
+    trace_memory   (bool): if True, also trace memory with tracemalloc
+                           (slows python allocations down)
+    """
+
+    global TRACER
+    events = []
+    previous = TRACER
+    started = trace_memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    TRACER = {'sink': sink or events.append, 'trace_memory': trace_memory, 'stack': [],
+              'thread': threading.get_ident()}
+    try:
+        yield events
+    finally:
+        TRACER = previous
+        if started:
+            tracemalloc.stop()
+
+
+# function to get a context manager that times one phase of a function
+# (e.g. 'add_geospatial_aux:fire') while instrumentation is on; it yields
+# a dictionary of event args, e.g. to set 'rows_out' at the end of the
+# phase, and is an empty null context when instrumentation is off
+def span(name, rows_in=None, **args):
+
+    if TRACER is None or TRACER['thread'] != threading.get_ident():
+        return nullcontext({})
+    return trace_span(name, rows_in, args)
+
+
+# function (a decorator) to wrap a function in a `span` named after it;
+# the input and output row counts are taken from the first dataframe,
+# series, or array argument and from the result (the first element if
+# it is a tuple)
+def traced(func):
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if TRACER is None or TRACER['thread'] != threading.get_ident():
+            return func(*args, **kwargs)
+        rows_in = next((n for n in map(count_rows, args) if n is not None), None)
+        with trace_span(func.__name__, rows_in, {}) as info:
+            result = func(*args, **kwargs)
+            info['rows_out'] = count_rows(result[0] if isinstance(result, tuple)
+                                          and result else result)
+        return result
+    return wrapper
+
+
+# function to write instrumentation events (see `instrument`) as a Chrome
+# trace JSON file, which can be opened in chrome://tracing or
+# https://ui.perfetto.dev
+def write_trace(events, path):
+
+    with open(path, 'w') as file:
+        json.dump({'traceEvents': list(events), 'displayTimeUnit': 'ms'},
+                  file, default=str)
+    return path
+
+
+# function to get an event sink for `instrument` that appends every
+# event to a JSON lines file as soon as it is emitted
+def json_lines_sink(path):
+
+    def sink(event):
+        with open(path, 'a') as file:
+            file.write(json.dumps(event, default=str) + '\n')
+    return sink
+
 ##########################################################################################
 # Main functions that are used in the notebooks. Roughly in order of usage.
 ##########################################################################################
 
+@traced
 def get_unique_species(DFRAME, SCOL, DNAME, SAVE=False, OUTP=False):
     
     """
@@ -67,67 +240,84 @@ def get_unique_species(DFRAME, SCOL, DNAME, SAVE=False, OUTP=False):
     return unique_species_df
 
 
-def add_leaf_retention(species_pft, evergrndecid, ret_col_name):
-    
+@traced
+def add_leaf_retention(species_pft, evergrndecid, ret_col_name, index=None):
+
     """
     Main function that adds a leaf retention column to a species-level
     dataframe. It matches the species name in one dataframe to the
-    species name in the macanander 22 supplementary table.
-    
-    species_pft  (dataframe): dataframe with species-level fcover data
+    species name in the macanander 22 supplementary table. Matching
+    is done with the hash lookups built by `leaf_retention_index`;
+    each unique species name is resolved once and broadcast back to
+    every row.
+
+    species_pft  (dataframe): dataframe with species-level fcover data;
+                              the species name must be the 2nd column
     evergrndecid (dataframe): dataframe with evergreen/deciduous info
+                              (ignored if index is provided)
     ret_col_name    (string): name of the new leaf retention column name
-    
+    index             (dict): optional prebuilt output of
+                              `leaf_retention_index`, so the lookup can
+                              be reused across datasets
     """
-    
-    # add evergreen/deciduous information
-    species_pft_l = species_pft.to_numpy()
-    evergrndecid_l = evergrndecid.to_numpy()
-    
-    newlist = []
-    for row in species_pft_l:
 
-        # get first 2 words in data species name
-        speciesname = row[1].split()[:2]
-        newrow = []
+    # build evergreen/deciduous lookups if not provided
+    if index is None:
+        index = leaf_retention_index(evergrndecid)
 
-        for row2 in evergrndecid_l:
-            # get first 2 words in evergreen/decid species name
-            speciesname2 = row2[1].split()[:2]
-            ed = None
+    # resolve each unique species name only once
+    codes, uniques = pd.factorize(species_pft.iloc[:, 1])
+    uniques = pd.Series(uniques, dtype=object)
+    exact = get_first_words(uniques, 2).map(index['species'])
+    genus = get_first_words(uniques, 1).map(index['genus'])
 
-            # if full NEON name == E/D name:
-            if speciesname == speciesname2:
-                #get evergreen/decid
-                ed = row2[0].split()
-                ed = ed[0]
+    # an exact genus-species match always shares its genus, so (as
+    # in the original row-by-row matcher) all genus matches are kept
+    empty = frozenset()
+    retention = []
+    for e, g in zip(exact, genus):
+        e = e if isinstance(e, frozenset) else empty
+        g = g if isinstance(g, frozenset) else empty
+        retention.append(','.join(sorted(e | g)))
 
-            # if data genus == E/D genus:
-            elif str(speciesname[0]) == str(speciesname2[0]):
-                #print(speciesname[0], 'and', speciesname2[0])
-                ed = row2[0].split()
-                ed = ed[0]
+    # broadcast back to rows; null names (code -1) get no match
+    retention = np.array(retention + [''], dtype=object)
+    species_pft[ret_col_name] = retention[codes]
+    return species_pft
 
-            # if they don't match, dont append
-            else:
-                continue
-            newrow.append(ed)
 
-        newlist.append(newrow)
-    
-    # get unique leaf habit values
-    final_l = []
-    for l in newlist:
-        newl = list(set(l))
-        string = ','.join(newl)
-        final_l.append(string)
-        
-    species_pft[ret_col_name] = final_l
-    return species_pft
+@traced
+def leaf_retention_index(evergrndecid):
 
+    """
+    Main function that builds genus-species and genus hash lookups
+    from the Macander 2022 leaf retention table. The result can be
+    built once and passed to `add_leaf_retention` for every dataset.
+    Returns a dictionary with 'species' and 'genus' keys; each maps
+    a name key to a frozenset of leaf retention values.
 
+    evergrndecid (dataframe): dataframe with evergreen/deciduous info
+                              from `leaf_retention_df`
+    """
+
+    # first word of the retention value, e.g. 'deciduous'
+    ref = pd.DataFrame({
+        'species': get_first_words(evergrndecid.iloc[:, 1], 2),
+        'genus': get_first_words(evergrndecid.iloc[:, 1], 1),
+        'retention': get_first_words(evergrndecid.iloc[:, 0], 1)})
+    ref = ref.dropna(subset=['retention'])
+
+    # one set of retention values per name key
+    index = {}
+    for level in ['species', 'genus']:
+        pairs = ref[[level, 'retention']].dropna().drop_duplicates()
+        index[level] = pairs.groupby(level)['retention'].apply(frozenset).to_dict()
+    return index
+
+
+@traced
 def join_to_checklist(unique_species, checklist, u_name, c_unofficial_name, 
-                      c_official_name, mapping_name, habit):
+                      c_official_name, mapping_name, habit, compiled=None):
     
     """
     Giant main function that iteratively tries to match a species name from
@@ -137,10 +327,13 @@ def join_to_checklist(unique_species, checklist, u_name, c_unofficial_name,
     match, it will compare the genus name to the accepted genus name, and 
     then the genus name to the synonym name. If no match is found, the habit
     is designated as NaN. If a match(es) is found, it will be the recorded
-    habit(s).
+    habit(s). The checklist is compiled into lookup tables once (see
+    `compile_checklist`) and all species are resolved in a single pass
+    (see `resolve_habits`).
     
     unique_species (dataframe): dataframe with fcover species names
     checklist      (dataframe): dataframe with checklist species names
+                                (ignored if compiled is provided)
     u_name            (string): column in unique_species dataframe that
                                 contains the species names
     c_unofficial_name (string): column in checklist dataframe that contains
@@ -152,160 +345,156 @@ def join_to_checklist(unique_species, checklist, u_name, c_unofficial_name,
                                 name used to join the two dataframes)
     habit             (string): column name from the checklist that contains
                                 the habit (PFT) associated with a species
+    compiled            (dict): optional prebuilt output of
+                                `compile_checklist`, so the checklist can be
+                                reused across datasets
     """
     
-    # assign habit to species
-    def create_checklist_habits(checklist, mapping_name, habit):
-
-        """
-        Subroutine function used in the `join_to_checklist` function
-        to generate a comma-separated list of "potential" PFT 
-        (habit) names as a value in a pandas dataframe
-
-        checklist (dataframe): the akveg species checklist dataframe
-        mapping_name (string): the column name used to merge the 
-                               checklist with the fcover dataframe
-        habit        (string): the checklist column name containing the 
-                               PFT designation for a species
-        """
-
-        # For every genus-species, create a list of potential habits
-        checklist_merge = (checklist
-                           .groupby(mapping_name)[habit]
-                           .apply(set)
-                           .reset_index())
-
-        # Make lists strings, remove brackets, remove whitespace
-        checklist_merge[habit] = (checklist_merge[habit]
-                                  .astype(str)
-                                  .str.strip('{}')
-                                  .str.strip("''")
-                                  .str.strip())
-
-        # clean up the strings created above
-        checklist_merge[habit] = checklist_merge[habit].apply(cleanlist)
-
-        # Return dataframe
-        return checklist_merge
-    
-    ######################################################################################
-    # compare genus-species to official name genus-species
-    ######################################################################################
-    # extract first two words (genus & species) of official name
-    unique_species[mapping_name] = unique_species[u_name].apply(get_substrings)
-    checklist[mapping_name] = checklist[c_official_name].apply(get_substrings)
-
-    # match unofficial name to blank habit species
-    checklist1 = create_checklist_habits(checklist=checklist, 
-                                         mapping_name=mapping_name, 
-                                         habit=habit)
-
-    # get habit for species based on unofficial name
-    species_pft = (unique_species
-                   .reset_index()
-                   .merge(checklist1, how='left', on=mapping_name)
-                   .set_index('index'))
-
-    # check if species habit is blank
-    species_pft1 = species_pft.replace('', np.nan)
-    missinghabit1 = species_pft1.loc[species_pft1.isna().any(axis=1)]
-    print(f'{len(missinghabit1)} species are missing habits.')
-    
-    ######################################################################################
-    # compare genus-species to UNofficial name genus-species
-    ######################################################################################
-    # extract first two words (genus & species) of official name
-    checklist2 = checklist.copy()
-    checklist2[mapping_name] = checklist2[c_unofficial_name].apply(get_substrings)
-
-    # match unofficial name to blank habit species
-    checklist2 = create_checklist_habits(checklist=checklist2, 
-                                         mapping_name=mapping_name, 
-                                         habit=habit)
-
-    # get habit for species based on unofficial name
-    species_pft2 = (missinghabit1
-                    .reset_index()
-                    .merge(checklist2, how='left', on=mapping_name, suffixes=['1','2'])
-                    .set_index('index'))
-
-    # show species that are still missing habits
-    newhabit2 = f'{habit}2'
-    missinghabit2 = species_pft2[species_pft2[newhabit2].isnull()]
-    print(f'{len(missinghabit2)} species still missing habits.')
-    
-    ######################################################################################
-    # compare genus to official name genus
-    ######################################################################################
-    # extract genus of official name and species name
-    checklist3 = checklist.copy()
-    checklist3[mapping_name] = checklist3[mapping_name].apply(get_first_substring)
-    missinghabit3 = missinghabit2.copy()
-    missinghabit3[mapping_name] = missinghabit2[mapping_name].apply(get_first_substring)
-
-    # match unofficial name to blank habit species
-    checklist3 = create_checklist_habits(checklist=checklist3,
-                                         mapping_name=mapping_name,
-                                         habit=habit)
-
-    # get habit for genus
-    species_pft3 = (missinghabit3
-                    .reset_index()
-                    .merge(checklist3, how='left', on=mapping_name, suffixes=['2','3'])
-                    .set_index('index'))
-
-    # show species that are still missing habits
-    newhabit3 = habit
-    missinghabit3 = species_pft3[species_pft3[newhabit3].isnull()]
-    print(f'{len(missinghabit3)} species still missing habits.')
-    
-    ######################################################################################
-    # compare genus to unofficial name genus
-    ######################################################################################
-    # extract genus of unofficial name and species name
-    checklist4 = checklist.copy()
-    checklist4[mapping_name] = checklist4[c_unofficial_name].apply(get_first_substring)
-    missinghabit4 = missinghabit3.copy()
-    missinghabit4[mapping_name] = missinghabit3[mapping_name].apply(get_first_substring)
-
-    # match unofficial name to blank habit species
-    checklist4 = create_checklist_habits(checklist=checklist4,
-                                         mapping_name=mapping_name,
-                                         habit=habit)
-
-    # get habit for genus
-    species_pft4 = (missinghabit3
-                    .reset_index()
-                    .merge(checklist4, how='left', on=mapping_name, suffixes=['3','4'])
-                    .set_index('index'))
-
-    # show species that are still missing habits
-    newhabit4 = f'{habit}4'
-    missinghabit4 = species_pft4[species_pft4[newhabit4].isnull()]
-    print(f'{len(missinghabit4)} species still missing habits.')
-    
-    ######################################################################################
-    # fill missing habit names
-    ######################################################################################
-    # set up columns for filling
-    fill1 = species_pft2[[newhabit2]]
-    fill2 = species_pft3[[newhabit3]]
-    fill2 = fill2.copy()
-    fill2.rename(columns={newhabit3: f'{habit}3'}, inplace=True)
-    fill3 = species_pft4[[newhabit4]]
-    finalhabits = pd.concat([species_pft, fill1, fill2, fill3], axis=1)
-    
-    # fill
-    finalhabits[habit] = finalhabits[habit].fillna(finalhabits[newhabit2])
-    finalhabits[habit] = finalhabits[habit].fillna(finalhabits[f'{habit}3'])
-    finalhabits[habit] = finalhabits[habit].fillna(finalhabits[newhabit4])
-    finalhabits = finalhabits[[u_name, mapping_name, habit]]
-    finalhabits.columns = [u_name, mapping_name, habit]
+    # compile checklist lookup tables if not provided
+    if compiled is None:
+        compiled = compile_checklist(checklist, c_unofficial_name, 
+                                     c_official_name, habit)
+    
+    # resolve every species name through all fallback levels
+    resolved = resolve_habits(unique_species[u_name], compiled)
+    unique_species[mapping_name] = resolved['joinKey']
+    
+    # show species that are still missing habits after each level
+    missing = len(resolved)
+    for i, level in enumerate(CHECKLIST_MATCH_LEVELS):
+        missing -= (resolved['matchLevel'] == level).sum()
+        still = 'are' if i == 0 else 'still'
+        print(f'{missing} species {still} missing habits.')
     
     # return dataframe
+    finalhabits = pd.DataFrame({u_name: unique_species[u_name],
+                                mapping_name: resolved['joinKey'],
+                                habit: resolved['habit']},
+                               index=unique_species.index)
     return finalhabits
 
 
+@traced
+def compile_checklist(checklist, c_unofficial_name, c_official_name, habit,
+                      keys=None):
+    
+    """
+    Main function that compiles the akveg species checklist into one
+    lookup table per `join_to_checklist` fallback level: accepted
+    genus-species, synonym genus-species, accepted genus, and synonym
+    genus. Each lookup is a pandas series of comma-separated "potential"
+    habits indexed by its sorted, unique join key. Compile once and reuse
+    the result for every dataset.
+    
+    checklist      (dataframe): dataframe with checklist species names
+    c_unofficial_name (string): column in checklist dataframe that contains
+                                the possible synonyms for an accepted name
+    c_official_name   (string): column in checklist dataframe that contains
+                                the accepted species names
+    habit             (string): column name from the checklist that contains
+                                the habit (PFT) associated with a species
+    keys           (dataframe): optional precomputed output of
+                                `checklist_keys` for this checklist
+    """
+    
+    # genus-species and genus keys for accepted names and synonyms
+    if keys is None:
+        keys = checklist_keys(checklist, c_unofficial_name, c_official_name)
+    habits = checklist[habit].replace('', np.nan)
+    
+    # for every key, create a sorted string of unique potential habits
+    compiled = {}
+    for level in CHECKLIST_MATCH_LEVELS:
+        pairs = pd.DataFrame({'key': keys[level].to_numpy(),
+                              'habit': habits.to_numpy()})
+        pairs = (pairs
+                 .dropna()
+                 .drop_duplicates()
+                 .sort_values(['key', 'habit']))
+        key = pairs['key'].to_numpy(dtype=object)
+        value = pairs['habit'].to_numpy(dtype=object)
+        
+        # join habits within each run of equal keys without a python groupby
+        first = np.r_[True, key[1:] != key[:-1]] if len(key) else np.array([], bool)
+        starts = np.flatnonzero(first)
+        value[~first] = ', ' + value[~first]
+        joined = np.add.reduceat(value, starts) if len(starts) else value
+        compiled[level] = pd.Series(joined, index=pd.Index(key[starts], name='key'),
+                                    name='habit', dtype=object)
+    return compiled
+
+
+@traced
+def checklist_keys(checklist, c_unofficial_name, c_official_name):
+    
+    """
+    Main function that derives the join keys used at every
+    `join_to_checklist` fallback level for each checklist row. Returns a
+    dataframe with the checklist index and one column per level in
+    `CHECKLIST_MATCH_LEVELS`.
+    
+    checklist      (dataframe): dataframe with checklist species names
+    c_unofficial_name (string): column in checklist dataframe that contains
+                                the possible synonyms for an accepted name
+    c_official_name   (string): column in checklist dataframe that contains
+                                the accepted species names
+    """
+    
+    accepted = get_substring_keys(checklist[c_official_name])
+    synonym = get_substring_keys(checklist[c_unofficial_name])
+    keys = pd.DataFrame({'accepted': accepted,
+                         'synonym': synonym,
+                         'genus': get_first_words(accepted, 1),
+                         'synonymGenus': get_first_words(synonym, 1)},
+                        index=checklist.index)
+    return keys
+
+
+@traced
+def resolve_habits(species, compiled):
+    
+    """
+    Main function that resolves a series of species names against the
+    lookup tables from `compile_checklist`. Each unique name is looked up
+    once, level by level, and only names that are still unmatched fall
+    through to the next level. Returns a dataframe with the same index as
+    the input series and columns 'joinKey' (genus-species key), 'habit',
+    and 'matchLevel' (the level that matched, or NaN).
+    
+    species (series): species names, e.g. 'datasetSpeciesName'
+    compiled  (dict): output of `compile_checklist`
+    """
+    
+    # derive join keys for unique names only
+    codes, uniques = pd.factorize(species)
+    uniques = pd.Series(uniques, dtype=object)
+    species_keys = get_substring_keys(uniques)
+    genus_keys = get_first_words(species_keys, 1)
+    
+    # walk the fallback levels
+    habits = np.full(len(uniques) + 1, np.nan, dtype=object)
+    levels = np.full(len(uniques) + 1, np.nan, dtype=object)
+    unmatched = np.ones(len(uniques), dtype=bool)
+    for level in CHECKLIST_MATCH_LEVELS:
+        with span(f'resolve_habits:{level}', rows_in=int(unmatched.sum())) as info:
+            lookup = compiled[level]
+            keys = species_keys if level in ['accepted', 'synonym'] else genus_keys
+            pos = lookup.index.get_indexer(keys.to_numpy())
+            hit = unmatched & (pos >= 0)
+            habits[:-1][hit] = lookup.to_numpy()[pos[hit]]
+            levels[:-1][hit] = level
+            unmatched &= ~hit
+            info['rows_out'] = int(hit.sum())
+    
+    # broadcast back to rows; null names (code -1) get no match
+    keys = np.append(species_keys.to_numpy(dtype=object), np.nan)
+    resolved = pd.DataFrame({'joinKey': keys[codes],
+                             'habit': habits[codes],
+                             'matchLevel': levels[codes]},
+                            index=species.index)
+    return resolved
+
+
 def add_standard_cols(df):
     
     """
@@ -344,7 +533,8 @@ def add_standard_cols(df):
     return df
 
 
-def neon_plot_centroids(dfs, DIR):
+@traced
+def neon_plot_centroids(dfs, DIR, cache_path=None, max_workers=8):
     
     """
     Main function for NEON data that is used to extract
@@ -352,12 +542,17 @@ def neon_plot_centroids(dfs, DIR):
     this data has to be queried online. The coordinates
     provided in the .csv are for the larger 40-meter plot.
     This function is not generalizable at all, apologies.
+    Locations are resolved with `neon_locations`, so each
+    subplot is requested once and reruns use the local cache.
     
     dfs   (list): list containing pandas dataframes with neon
                   fcover data (pandas dataframes created from
                   the TOOL.csv and BARR.csv
     DIR (string): path to the output .csv that combines TOOL
                   and BARR .csvs
+    cache_path (string): optional path to the sqlite location
+                         cache (default is DIR/neon_locations.sqlite)
+    max_workers   (int): number of concurrent requests
     """
     
     # create name column to exract plot centroids
@@ -365,39 +560,104 @@ def neon_plot_centroids(dfs, DIR):
     df.reset_index(inplace=True, drop=True)
     df['name'] = df.namedLocation + '.' + df.subplotID
     
-    # get subplot lat/lon from server
-    requests_dict = {}
-    plots = df['name'].to_list()
-    url = 'http://data.neonscience.org/api/v0/locations/'
-    locs = []
-
-    for plot in plots:
-
-        # only get response when the request is new
-        response = None
-        if plot not in list(requests_dict.keys()):
-            response = requests.get(url + plot)
-            requests_dict[plot] = response
-        else:
-            response = requests_dict[plot]
-        # print(url + plot, end='\r')
-
-        # extract lat/lon
-        try:
-            lat = response.json()['data']['locationDecimalLatitude']
-            lon = response.json()['data']['locationDecimalLongitude']
-        except Exception as e:
-            # print(response.content)
-            print(e)
-            lat, lon = None, None
-        locs.append([lat,lon])
+    # get subplot lat/lon from server (or cache)
+    if cache_path is None:
+        cache_path = os.path.join(DIR, 'neon_locations.sqlite')
+    locs = neon_locations(df['name'], cache_path, max_workers=max_workers)
         
     # add coordinate data to rows
-    coords = pd.DataFrame(locs, columns=['subplot_lat','subplot_lon'])
+    coords = locs.reindex(df['name']).reset_index(drop=True)
+    coords.columns = ['subplot_lat', 'subplot_lon']
     new_df = pd.concat([df, coords], axis=1)
     new_df.to_csv(DIR + '/NEON.D18.TOOLBARR.DP1.10058.001.div_1m2Data.2021.csv')
+
+
+@traced
+def neon_locations(names, cache_path, url=NEON_LOCATIONS_URL, max_workers=8,
+                   retries=3, backoff=1.0, timeout=30):
+    
+    """
+    Main function that resolves NEON named locations to decimal latitude
+    and longitude. Names are deduplicated, looked up in a local sqlite
+    cache, and only the missing ones are requested concurrently over one
+    pooled session (bounded by max_workers), with retries and exponential
+    backoff for timeouts, connection errors, 429, and 5xx responses.
+    Successful lookups and definitive misses (other 4xx responses) are
+    cached, so reruns make no network calls. Returns a dataframe indexed
+    by name with 'latitude' and 'longitude' columns.
+    
+    names     (iterable): NEON named locations, e.g. 'TOOL_001.basePlot.div.31.1.1'
+    cache_path  (string): path to the sqlite cache file
+    url         (string): base url of the NEON locations API
+    max_workers    (int): maximum number of concurrent requests
+    retries        (int): number of retries for transient failures
+    backoff      (float): initial backoff in seconds, doubled per retry
+    timeout      (float): request timeout in seconds
+    """
     
+    names = pd.unique(pd.Series(list(names), dtype=object).dropna())
+    os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+    with closing(sqlite3.connect(cache_path)) as con:
+        con.execute('CREATE TABLE IF NOT EXISTS locations '
+                    '(name TEXT PRIMARY KEY, latitude REAL, longitude REAL)')
+        cached = pd.read_sql_query('SELECT * FROM locations', con, index_col='name')
+        todo = [name for name in names if name not in cached.index]
+        
+        # fetch missing locations concurrently over one pooled session
+        if todo:
+            import requests
+            rows = []
+            with requests.Session() as session:
+                adapter = requests.adapters.HTTPAdapter(pool_maxsize=max_workers)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                    results = pool.map(lambda name: fetch_neon_location(
+                        session, url, name, retries, backoff, timeout), todo)
+                    for name, result in zip(todo, results):
+                        if result is not None:
+                            rows.append((name, *result))
+            con.executemany('INSERT OR REPLACE INTO locations VALUES (?, ?, ?)', rows)
+            con.commit()
+            cached = pd.read_sql_query('SELECT * FROM locations', con, index_col='name')
+    
+    return cached.reindex(names)[['latitude', 'longitude']]
 
+
+def fetch_neon_location(session, url, name, retries=3, backoff=1.0, timeout=30):
+    
+    """
+    Main function that requests one NEON named location. Returns a
+    (latitude, longitude) tuple, (None, None) if the location does not
+    exist (4xx other than 429), or None if the request kept failing.
+    
+    session (session): requests session to reuse connections from
+    url      (string): base url of the NEON locations API
+    name     (string): NEON named location
+    retries     (int): number of retries for transient failures
+    backoff   (float): initial backoff in seconds, doubled per retry
+    timeout   (float): request timeout in seconds
+    """
+    
+    import requests
+    for attempt in range(retries + 1):
+        try:
+            response = session.get(url + name, timeout=timeout)
+            if response.status_code == 429 or response.status_code >= 500:
+                raise requests.HTTPError(f'{response.status_code} for {name}')
+            if response.status_code >= 400:
+                print(f'{response.status_code} for {name}')
+                return None, None
+            data = response.json()['data']
+            return data['locationDecimalLatitude'], data['locationDecimalLongitude']
+        except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+            if attempt == retries:
+                print(e)
+                return None
+            time.sleep(backoff * 2 ** attempt)
+
+
+@traced
 def leaf_retention_df(path):
     
     """
@@ -414,6 +674,7 @@ def leaf_retention_df(path):
     return df
 
 
+@traced
 def checklist_df(path):
     
     """
@@ -423,6 +684,7 @@ def checklist_df(path):
     path (string): path to the AKVEG species checklist table
     """
     
+    from pyogrio import read_dataframe
     df = read_dataframe(path)
     df.rename(columns={'Code': 'nameCode',
                        'Name':'checklistSpeciesName',
@@ -437,6 +699,264 @@ def checklist_df(path):
     return df
 
 
+@traced
+def cached_checklist(path, cache_dir, c_unofficial_name='checklistSpeciesName',
+                     c_official_name='nameAccepted', habit='speciesHabit'):
+    
+    """
+    Main function that returns the cleaned AKVEG species checklist
+    (see `checklist_df`) and its compiled habit lookups (see
+    `compile_checklist`) from a parquet cache. The checklist is stored with
+    its join key columns; the lookups are stored as one long table. Cache
+    files are named after the checklist's content hash and the module
+    `__version__`, so they are rebuilt automatically when either changes;
+    stale cache files for the same checklist are removed.
+    
+    path              (string): path to the AKVEG species checklist table
+    cache_dir         (string): path to directory where the cache is kept
+    c_unofficial_name (string): checklist column containing synonyms
+    c_official_name   (string): checklist column containing accepted names
+    habit             (string): checklist column containing the habit
+    """
+    
+    # cache file names from the checklist content and module version
+    stem = os.path.splitext(os.path.basename(path))[0]
+    key = f'{stem}_{file_hash(path)[:16]}_v{__version__}'
+    checklist_path = os.path.join(cache_dir, f'{key}.checklist.parquet')
+    lookup_path = os.path.join(cache_dir, f'{key}.lookup.parquet')
+    
+    # warm start: no csv parsing or key derivation
+    if os.path.exists(checklist_path) and os.path.exists(lookup_path):
+        checklist = pd.read_parquet(checklist_path)
+        lookup = pd.read_parquet(lookup_path)
+        compiled = {}
+        for level in CHECKLIST_MATCH_LEVELS:
+            rows = lookup[lookup['level'] == level]
+            compiled[level] = pd.Series(rows['habit'].to_numpy(dtype=object),
+                                        index=pd.Index(rows['key'], name='key'),
+                                        name='habit', dtype=object)
+        return checklist, compiled
+    
+    # cold start: parse, derive keys, and compile
+    checklist = checklist_df(path)
+    keys = checklist_keys(checklist, c_unofficial_name, c_official_name)
+    compiled = compile_checklist(checklist, c_unofficial_name, c_official_name,
+                                 habit, keys=keys)
+    checklist = pd.concat([checklist, keys.add_suffix('Key')], axis=1)
+    lookup = pd.concat([pd.DataFrame({'level': level,
+                                      'key': compiled[level].index,
+                                      'habit': compiled[level].to_numpy()})
+                        for level in CHECKLIST_MATCH_LEVELS], ignore_index=True)
+    
+    # remove stale caches for this checklist and write the new one
+    os.makedirs(cache_dir, exist_ok=True)
+    remove_stale_cache(cache_dir, f'{stem}_' + '?' * 16 + '_v*.parquet', key)
+    write_atomic(checklist.to_parquet, checklist_path)
+    write_atomic(lambda tmp: lookup.to_parquet(tmp, index=False), lookup_path)
+    return checklist, compiled
+
+
+@traced
+def build_name_index(names, n=3):
+    
+    """
+    Main function that builds a character n-gram inverted index over a
+    list of names (e.g. every checklist name and synonym) for fuzzy
+    matching with `match_names`. Names are lowercased and their whitespace
+    is collapsed before they are split into n-grams (padded with spaces,
+    so first and last letters count). The index is a dictionary holding
+    the unique names, their normalized forms, the sorted n-gram vocabulary
+    (each n-gram packed into one integer), and a sparse binary name x
+    n-gram matrix; see `save_name_index` to serialize it.
+    
+    names (list): names to index; nulls and duplicates are dropped
+    n      (int): n-gram length (1 to 3)
+    """
+    
+    if not 1 <= n <= 3:
+        raise ValueError(f'n-gram length must be 1 to 3, got {n}')
+    names = pd.unique(pd.Series(names, dtype=object).dropna().to_numpy())
+    rows, keys, normalized = name_grams(names, n)
+    grams, cols = np.unique(keys, return_inverse=True)
+    from scipy.sparse import csr_matrix
+    matrix = csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols.ravel())),
+                        shape=(len(names), len(grams)))
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return {'names': np.asarray(names, dtype=object), 'normalized': normalized,
+            'grams': grams, 'matrix': matrix, 'n': n}
+
+
+@traced
+def cached_name_index(path, cache_dir, columns=('checklistSpeciesName', 'nameAccepted'),
+                      n=3):
+    
+    """
+    Main function that returns the n-gram name index (see
+    `build_name_index`) over all names and synonyms of the AKVEG species
+    checklist. The index is built once and serialized to cache_dir (see
+    `save_name_index`) under the checklist's content hash and the module
+    `__version__`, like `cached_checklist`.
+    
+    path      (string): path to the AKVEG species checklist table
+    cache_dir (string): path to directory where the cache is kept
+    columns     (list): checklist columns with names to index
+    n            (int): n-gram length
+    """
+    
+    stem = os.path.splitext(os.path.basename(path))[0]
+    key = f'{stem}_{file_hash(path)[:16]}_v{__version__}'
+    index_path = os.path.join(cache_dir, f'{key}.names{n}.npz')
+    if os.path.exists(index_path):
+        return load_name_index(index_path)
+    
+    # build from the (cached) checklist and remove stale indexes
+    checklist, _ = cached_checklist(path, cache_dir)
+    names = pd.concat([checklist[col] for col in columns], ignore_index=True)
+    index = build_name_index(names, n)
+    remove_stale_cache(cache_dir, f'{stem}_' + '?' * 16 + f'_v*.names{n}.npz', key)
+    save_name_index(index, index_path)
+    return index
+
+
+@traced
+def match_names(queries, index, k=5, candidates=20, batch_size=1024):
+    
+    """
+    Main function that ranks the closest indexed names (see
+    `build_name_index`) for every query name, e.g. the species without a
+    habit after `join_to_checklist`. For a batch of queries, candidates
+    sharing n-grams with a query are found with one sparse matrix product
+    over the inverted index and the best `candidates` by n-gram (Dice)
+    similarity are kept; those are then scored by edit (Levenshtein)
+    distance between the normalized names, computed for all pairs at
+    once. Returns a long dataframe with up to k rows per query name:
+    'datasetSpeciesName', 'rank', 'candidateName', 'editDistance',
+    'similarity' (1 - distance / longer length) and 'ngramSimilarity'.
+    Queries without any shared n-gram have no rows.
+    
+    queries  (series): names to match; nulls are ignored
+    index      (dict): output of `build_name_index` or `load_name_index`
+    k           (int): number of ranked candidates to return per name
+    candidates  (int): number of n-gram candidates scored by edit distance
+    batch_size  (int): number of query names per sparse product, which
+                       bounds memory
+    """
+    
+    queries = pd.unique(pd.Series(queries, dtype=object).dropna().to_numpy())
+    rows, keys, normalized = name_grams(queries, index['n'])
+    grams, matrix = index['grams'], index['matrix']
+    
+    # distinct n-grams per query (including n-grams not in the index)
+    distinct = pd.DataFrame({'row': rows, 'key': keys}).drop_duplicates()
+    query_sizes = np.bincount(distinct['row'], minlength=len(queries))
+    name_sizes = np.diff(matrix.indptr)
+    pos = np.minimum(np.searchsorted(grams, distinct['key'].to_numpy()), max(len(grams) - 1, 0))
+    known = (grams[pos] == distinct['key'].to_numpy()) if len(grams) else pos < 0
+    from scipy.sparse import csr_matrix
+    query_matrix = csr_matrix((np.ones(known.sum(), dtype=np.float32),
+                               (distinct['row'].to_numpy()[known], pos[known])),
+                              shape=(len(queries), len(grams)))
+    
+    # n-gram candidates per batch of queries: top Dice similarity
+    q_idx, c_idx, dice = [], [], []
+    for start in range(0, len(queries), batch_size):
+        shared = (query_matrix[start:start + batch_size] @ matrix.T).tocsr()
+        counts = np.diff(shared.indptr)
+        q = np.repeat(np.arange(len(counts)) + start, counts)
+        sim = 2 * shared.data / (query_sizes[q] + name_sizes[shared.indices])
+        
+        # only sort what can make a query's top candidates: the pairs at or
+        # above the query's candidates-th best similarity
+        threshold = np.zeros(len(counts))
+        for row in np.flatnonzero(counts > candidates):
+            row_sim = sim[shared.indptr[row]:shared.indptr[row + 1]]
+            threshold[row] = np.partition(row_sim, -candidates)[-candidates]
+        keep = sim >= np.repeat(threshold, counts)
+        q, col, sim = q[keep], shared.indices[keep], sim[keep]
+        order = np.lexsort((col, -sim, q))
+        q, col, sim = q[order], col[order], sim[order]
+        keep = np.arange(len(q)) - np.searchsorted(q, q) < candidates
+        q_idx.append(q[keep])
+        c_idx.append(col[keep])
+        dice.append(sim[keep])
+    q_idx = np.concatenate(q_idx) if q_idx else np.array([], dtype=np.int64)
+    c_idx = np.concatenate(c_idx) if c_idx else np.array([], dtype=np.int64)
+    dice = np.concatenate(dice) if dice else np.array([], dtype=np.float64)
+    
+    # score candidates by edit distance and keep the k best per query
+    distance = levenshtein_distances(normalized[q_idx], index['normalized'][c_idx])
+    longest = np.maximum(np.char.str_len(normalized[q_idx].astype(str)),
+                         np.char.str_len(index['normalized'][c_idx].astype(str)))
+    similarity = 1 - distance / np.maximum(longest, 1)
+    order = np.lexsort((index['names'][c_idx], -dice, -similarity, q_idx))
+    q_idx, c_idx = q_idx[order], c_idx[order]
+    rank = np.arange(len(q_idx)) - np.searchsorted(q_idx, q_idx) + 1
+    keep = rank <= k
+    order = order[keep]
+    return pd.DataFrame({'datasetSpeciesName': queries[q_idx[keep]],
+                         'rank': rank[keep],
+                         'candidateName': index['names'][c_idx[keep]],
+                         'editDistance': distance[order],
+                         'similarity': similarity[order],
+                         'ngramSimilarity': dice[order]})
+
+
+@traced
+def read_ava_cover_tables(paths, n_jobs=None, header=1,
+                          na_values=(-9, -9.0, '-9', '-9.0'),
+                          sample_size=1 << 16):
+    
+    """
+    Main function that reads the per-dataset AVA cover tables into one
+    long-format dataframe with 'plotName', 'datasetSpeciesName', 'cover',
+    and 'fcoverScale' columns (one row per non-empty cell). Covers are kept
+    as the raw strings from the table because some tables use ordinal
+    cover codes; 'fcoverScale' is taken from the file name (e.g. 'brbl').
+    Each file is parsed once: its encoding is detected from a bounded
+    sample (see `encoding_candidates`), falling back to the next candidate
+    only if decoding fails, and cached per file; rows are parsed straight
+    into the long format without building a wide dataframe.
+    Tables are read concurrently in a process pool.
+    
+    paths          (list): paths to the AVA cover table .csvs; columns 0-2
+                           are species names and columns 3+ are plot IDs
+    n_jobs          (int): optional number of worker processes (default
+                           is one per cpu; 1 reads the tables serially)
+    header          (int): row number containing the plot IDs
+    na_values      (list): cell values that mean no cover
+    sample_size     (int): number of bytes used to detect the encoding
+    """
+    
+    # look up encodings that were already detected this session
+    paths = list(paths)
+    keys = [encoding_key(path) for path in paths]
+    encodings = [FILE_ENCODINGS.get(key) for key in keys]
+    na_values = [str(value) for value in na_values]
+    args = [paths, encodings, [header] * len(paths),
+            [na_values] * len(paths), [sample_size] * len(paths)]
+    
+    # read tables concurrently
+    n_jobs = n_jobs or min(len(paths), os.cpu_count() or 1)
+    if n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            tables = list(pool.map(read_cover_table, *args))
+    else:
+        tables = list(map(read_cover_table, *args))
+    
+    # cache encodings and combine the long tables
+    long_dfs = []
+    for path, key, (encoding, table) in zip(paths, keys, tables):
+        FILE_ENCODINGS[key] = encoding
+        table['fcoverScale'] = os.path.basename(path).split('_')[-2]
+        long_dfs.append(table)
+    columns = ['plotName', 'datasetSpeciesName', 'cover', 'fcoverScale']
+    if not long_dfs:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(long_dfs, ignore_index=True)[columns]
+
+
+@traced
 def export_habit_files(habits_df, outdir, dataname, habitcol):
     
     """
@@ -469,6 +989,58 @@ def export_habit_files(habits_df, outdir, dataname, habitcol):
     return shrubs, nonshrubs, null
 
 
+@traced
+def standardize_habits(habits, leaf_retention, source=None, rules=None):
+    
+    """
+    Main function that maps checklist habits to standard PFTs with an
+    ordered rule table. Each rule is a (regex, PFT) pair matched against
+    the lowercased habit; the first matching rule wins and '{leaf}' in
+    the PFT is filled with the leaf retention (e.g. '{leaf} shrub' ->
+    'deciduous shrub'). Habits that match no rule are kept (lowercased).
+    Rules are evaluated once per unique habit and leaf retention pair
+    and broadcast back through integer codes. Null habits stay null.
+    
+    habits         (series): habits to standardize, e.g. 'moss'
+    leaf_retention (series): leaf retention of each row, e.g. 'evergreen'
+    source         (string): optional datasource name whose rules in
+                             HABIT_RULE_OVERRIDES are tried first
+    rules            (list): optional rule table to use instead of
+                             HABIT_RULE_OVERRIDES + HABIT_RULES
+    """
+    
+    if rules is None:
+        rules = HABIT_RULE_OVERRIDES.get(source, []) + HABIT_RULES
+    
+    # encode unique habit and leaf retention pairs
+    habit_codes, habit_values = pd.factorize(pd.Series(habits).to_numpy())
+    leaf_codes, leaf_values = pd.factorize(pd.Series(leaf_retention).to_numpy(),
+                                           use_na_sentinel=False)
+    pair_codes, pairs = pd.factorize(habit_codes.astype(np.int64) * max(len(leaf_values), 1)
+                                     + leaf_codes)
+    
+    # first matching rule template for each unique habit
+    lowered = pd.Series(habit_values, dtype=object).astype(str).str.lower()
+    templates = lowered.str.replace('{', '{{').str.replace('}', '}}').to_numpy()
+    unmatched = np.ones(len(lowered), dtype=bool)
+    for pattern, pft in rules:
+        match = unmatched & lowered.str.contains(pattern, regex=True).to_numpy(dtype=bool)
+        templates[match] = pft
+        unmatched &= ~match
+    
+    # fill leaf retention for each unique pair and broadcast to rows
+    standard = np.empty(len(pairs), dtype=object)
+    for i, pair in enumerate(pairs):
+        habit_code, leaf_code = divmod(pair, max(len(leaf_values), 1))
+        if habit_code < 0:
+            standard[i] = np.nan
+        else:
+            standard[i] = templates[habit_code].format(leaf=leaf_values[leaf_code])
+    return pd.Series(standard[pair_codes], index=getattr(habits, 'index', None),
+                     name=getattr(habits, 'name', None))
+
+
+@traced
 def add_standard_cols(df, pft_cols):
     
     """
@@ -490,7 +1062,75 @@ def add_standard_cols(df, pft_cols):
     df[addcols] = np.nan
     return df
 
-def add_geospatial_aux(df, paths, names, colnames, epsg):
+
+@traced
+def aggregate_pft_cover(species_fcover, pfts=None, derived=DERIVED_PFTS,
+                        plot_col='plotName', species_col='datasetSpeciesName',
+                        habit_col='standardHabit', cover_col='percentCover'):
+    
+    """
+    Main function that sums species-level fcover to PFT-level fcover
+    without a dense pivot. Plots and species are encoded as integer codes
+    to build a sparse plot x species cover matrix, which is multiplied by
+    a sparse species x PFT membership matrix. Derived PFTs (e.g.
+    non-vascular = bryophyte + lichen) are extra columns of the membership
+    matrix. Returns a plot x PFT dataframe sorted by plot; PFTs that are
+    not present in the data are NaN (see `add_standard_cols`) and present
+    PFTs are 0 in plots without them.
+    
+    species_fcover (dataframe): long-format species-level fcover data
+    pfts                (list): optional PFT columns to return, in order
+                                (default is every habit in the data,
+                                sorted, followed by the derived PFTs)
+    derived             (dict): derived PFT name -> list of habits it sums
+    plot_col          (string): column containing the plot names
+    species_col       (string): column containing the species names
+    habit_col         (string): column containing the standard habit
+    cover_col         (string): column containing the fcover
+    """
+    
+    # encode plots, habits, and (species, habit) pairs as integer codes;
+    # rows without a plot or habit are dropped and missing covers are 0
+    plot_codes, plots = pd.factorize(species_fcover[plot_col], sort=True)
+    habit_codes, habits = pd.factorize(species_fcover[habit_col])
+    species_codes, _ = pd.factorize(species_fcover[species_col], use_na_sentinel=False)
+    cover = pd.to_numeric(species_fcover[cover_col], errors='coerce').fillna(0).to_numpy(dtype=float)
+    keep = (plot_codes >= 0) & (habit_codes >= 0)
+    if not keep.all():
+        plot_codes, habit_codes = plot_codes[keep], habit_codes[keep]
+        species_codes, cover = species_codes[keep], cover[keep]
+        used, plot_codes = np.unique(plot_codes, return_inverse=True)
+        plots = plots[used]
+        used, habit_codes = np.unique(habit_codes, return_inverse=True)
+        habits = habits[used]
+    species_codes, pairs = pd.factorize(species_codes.astype(np.int64) * len(habits)
+                                        + habit_codes)
+    
+    # sparse plot x species cover matrix (duplicate cells are summed)
+    from scipy.sparse import coo_matrix, csr_matrix
+    cover_matrix = coo_matrix((cover, (plot_codes, species_codes)),
+                              shape=(len(plots), len(pairs))).tocsr()
+    
+    # sparse species x PFT membership matrix; derived PFTs include
+    # every habit they sum
+    habits = np.asarray(habits, dtype=object)
+    if pfts is None:
+        pfts = sorted(habits) + [name for name, parts in derived.items()
+                                 if name not in habits and np.isin(parts, habits).any()]
+    habit_members = np.zeros((len(habits), len(pfts)), dtype=bool)
+    for j, name in enumerate(pfts):
+        habit_members[:, j] = np.isin(habits, [name] + list(derived.get(name, [])))
+    membership = csr_matrix(habit_members[pairs % max(len(habits), 1)], dtype=float)
+    
+    # plot x PFT cover; PFTs absent from the data are null
+    pft_cover = (cover_matrix @ membership).toarray()
+    pft_cover[:, ~habit_members.any(axis=0)] = np.nan
+    return pd.DataFrame(pft_cover, index=pd.Index(plots, name=plot_col), columns=list(pfts))
+
+
+@traced
+def add_geospatial_aux(df, paths, names, colnames, epsg, cache_dir=None,
+                       aggregate=None, n_jobs=None, n_chunks=None):
     
     """
     Main function that, given a list of paths, reads a shapefile
@@ -498,7 +1138,17 @@ def add_geospatial_aux(df, paths, names, colnames, epsg):
     finds the intersection between a provided dataframe of points 
     and the shapefile geodataframes. Geodataframes must be in the
     same projection (EPSG:4326 yields incorrect results; choose a
-    projected EPSG).
+    projected EPSG). Layers are prepared once by
+    `prepare_geospatial_layer`; if cache_dir is provided, the prepared
+    layers are persisted there and later calls only run the
+    point-in-polygon queries. By default, a point that intersects several
+    polygons of a layer is duplicated (one row per polygon); layers named
+    in aggregate are instead reduced per point (see
+    `query_geospatial_layer`) so the output keeps one row per point.
+    If n_jobs > 1, the points are split into spatially coherent (Hilbert
+    curve ordered) chunks that are queried in a process pool; workers
+    read each layer from a memory-mapped WKB file instead of receiving it
+    with every task. The result is identical to the serial result.
     
     df  (dataframe): geodataframe of points to add intersections to
     paths    (list): list of paths to shapefiles of polygons
@@ -507,63 +1157,1171 @@ def add_geospatial_aux(df, paths, names, colnames, epsg):
                      keep during intersection
     epsg   (string): EPSG code indicating a shared projection 
                      between the df and shapefiles
+    cache_dir (string): optional path to directory where prepared
+                        (reprojected and validated) layers are kept
+    aggregate   (dict): optional mapping of layer name to 'list', 'count',
+                        'min', or 'max', e.g. {'fire': 'list'}; aggregated
+                        layers do not add an index_<name> column
+    n_jobs       (int): optional number of worker processes
+    n_chunks     (int): optional number of point chunks (default is
+                        4 * n_jobs)
     """
     
+    import geopandas as gpd
     new_df = df.copy()
+    aggregate = aggregate or {}
+    parallel = n_jobs is not None and n_jobs > 1 and len(new_df) > 0
+    pool = ProcessPoolExecutor(max_workers=n_jobs) if parallel else None
+    tempdir = tempfile.TemporaryDirectory() if parallel else None
+    try:
+        for i, (path, name, cnames) in enumerate(zip(paths, names, colnames)):
+            with span(f'add_geospatial_aux:{name}', rows_in=len(new_df)) as info:
+                
+                gdf = prepare_geospatial_layer(path, epsg, cache_dir, cnames)
+                
+                # overlapping column names are suffixed by sjoin; keep those serial
+                added = [c for c in cnames if c != gdf.geometry.name] + [f'index_{name}']
+                overlap = name not in aggregate and bool(set(added) & set(new_df.columns))
+                pairs = None
+                if parallel and not overlap:
+                    prefix = os.path.join(tempdir.name, f'layer{i}')
+                    pairs = parallel_layer_query(new_df, gdf, pool, prefix,
+                                                 n_chunks or 4 * n_jobs)
+                
+                if name in aggregate:
+                    reduced = query_geospatial_layer(new_df, gdf, cnames, 
+                                                     aggregate[name], name, pairs)
+                    for col in reduced.columns:
+                        new_df[col] = reduced[col].array
+                elif pairs is not None:
+                    new_df = join_layer_pairs(new_df, gdf[cnames], pairs, name)
+                else:
+                    new_df = gpd.sjoin(new_df, gdf[cnames], 
+                                       how='left', predicate='intersects', rsuffix=name)
+                info['polygons'] = len(gdf)
+                info['rows_out'] = len(new_df)
+    finally:
+        if parallel:
+            pool.shutdown()
+            tempdir.cleanup()
+        
+    return new_df
+
+
+@traced
+def query_geospatial_layer(points, layer, cnames, how, name, pairs=None):
     
-    def fix_geometries(gdf):
-        valid_geoms = gdf[gdf['geometry'].notna()].copy()
-        none_geoms = gdf[gdf['geometry'].isna()].copy()
-        valid_geoms['geometry'] = valid_geoms['geometry'].apply(make_valid)
-        return valid_geoms
+    """
+    Main function that finds the polygons of a prepared layer that
+    intersect each point with one bulk spatial-index query and reduces
+    the hits per point, so the result has exactly one row per point
+    (same index and order as points). Points without hits get NaN
+    (or a count of 0).
     
-    def read_geospatial(path):
-        gdf = gpd.read_file(path)
-        gdf = gdf.to_crs(epsg)
-        gdf = fix_geometries(gdf)
-        return gdf
+    points (geodataframe): geodataframe of points, in the layer's projection
+    layer  (geodataframe): prepared polygon layer, e.g. from
+                           `prepare_geospatial_layer`
+    cnames         (list): layer columns to reduce; geometry is skipped
+    how          (string): 'list' (sorted unique values), 'count' (number
+                           of intersecting polygons, as count_<name>),
+                           'min', or 'max'
+    name         (string): name of the layer, e.g. 'fire'
+    pairs         (tuple): optional precomputed (point position, polygon
+                           position) arrays, e.g. from
+                           `parallel_layer_query`
+    """
+    
+    if how not in ['list', 'count', 'min', 'max']:
+        raise ValueError(f"Unknown aggregation '{how}'; "
+                         "use 'list', 'count', 'min', or 'max'.")
     
-    for path, name, cnames in zip(paths, names, colnames):
+    # (point position, polygon position) pairs for every intersection
+    if pairs is None:
+        pairs = layer.sindex.query(points.geometry.values, predicate='intersects')
+    point_pos, layer_pos = pairs
+    n = len(points)
+    reduced = pd.DataFrame(index=points.index)
+    if how == 'count':
+        reduced[f'count_{name}'] = np.bincount(point_pos, minlength=n)
+        return reduced
+    
+    for col in [c for c in cnames if c != layer.geometry.name]:
+        hits = pd.DataFrame({'point': point_pos, 
+                             'value': layer[col].to_numpy()[layer_pos]}).dropna()
         
-        gdf = read_geospatial(path)
-        gdf = fix_geometries(gdf)
-        new_df = gpd.sjoin(new_df, gdf[cnames], 
-                           how='left', predicate='intersects', rsuffix=name)
+        # min/max with a cythonized groupby over integer point positions
+        if how in ['min', 'max']:
+            values = hits.groupby('point')['value'].agg(how).reindex(range(n))
+            if pd.api.types.is_integer_dtype(layer[col]):
+                values = values.astype('Int64')
+            reduced[col] = values.array
         
-    return new_df
+        # sorted unique lists from runs of equal point positions
+        else:
+            hits = hits.drop_duplicates().sort_values(['point', 'value'])
+            point = hits['point'].to_numpy()
+            values = np.full(n, np.nan, dtype=object)
+            if len(point):
+                starts = np.flatnonzero(np.r_[True, point[1:] != point[:-1]])
+                groups = np.split(hits['value'].to_numpy(), starts[1:])
+                values[point[starts]] = [group.tolist() for group in groups]
+            reduced[col] = values
+    
+    return reduced
+
+
+# prepared layers that have already been loaded in this session, keyed
+# by source path, projection and columns, along with the signature of the
+# layer's files they were prepared from; see `prepare_geospatial_layer`
+PREPARED_LAYERS = {}
+
+
+@traced
+def prepare_geospatial_layer(path, epsg, cache_dir=None, cnames=None):
+    
+    """
+    Main function that reads a polygon layer, reprojects it, drops
+    null geometries and fixes invalid geometries (vectorized), and
+    builds its spatial index (an STR-packed tree). If cache_dir is
+    provided, the prepared layer is written there as GeoParquet, named
+    after the content hash of the layer's files, the EPSG code, and the
+    module `__version__`; later calls read it back instead of
+    re-preparing the source. Prepared layers are also kept in memory
+    (`PREPARED_LAYERS`) for the rest of the session, as long as the
+    modification times and sizes of the layer's files do not change.
+    
+    path      (string): path to the shapefile of polygons
+    epsg      (string): EPSG code to reproject the layer to
+    cache_dir (string): optional path to directory where prepared
+                        layers are kept
+    cnames      (list): optional list of columns to load; all columns
+                        are prepared and stored
+    """
+    
+    # only columns that are needed are read back
+    columns = None if cnames is None else list(cnames)
+    memo_key = (os.path.abspath(path), str(epsg), 
+                None if columns is None else tuple(columns))
+    signature = layer_signature(path)
+    if memo_key in PREPARED_LAYERS and PREPARED_LAYERS[memo_key][0] == signature:
+        return PREPARED_LAYERS[memo_key][1]
+    
+    # warm start: read the prepared layer
+    import geopandas as gpd
+    prepared_path = None
+    if cache_dir is not None:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        crs = str(epsg).replace(':', '')
+        key = f'{stem}_{layer_hash(path)[:16]}_{crs}_v{__version__}'
+        prepared_path = os.path.join(cache_dir, f'{key}.parquet')
+    if prepared_path is not None and os.path.exists(prepared_path):
+        gdf = gpd.read_parquet(prepared_path, columns=columns)
+    
+    # cold start: read, reproject, and fix geometries once
+    else:
+        gdf = gpd.read_file(path)
+        gdf = gdf.to_crs(epsg)
+        gdf = gdf[gdf.geometry.notna()].copy()
+        gdf['geometry'] = gdf.geometry.make_valid()
+        if prepared_path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            remove_stale_cache(cache_dir, f'{stem}_' + '?' * 16 + f'_{crs}_v*.parquet', key)
+            write_atomic(gdf.to_parquet, prepared_path)
+        if columns is not None:
+            gdf = gdf[columns]
+    
+    # build the spatial index now so every query can reuse it
+    gdf.sindex
+    PREPARED_LAYERS[memo_key] = (signature, gdf)
+    return gdf
 
 # populates a column with the indicies of duplicated
 # information; e.g., duplicate coords or dates
-def find_duplicates(df, subset, col_name):
+@traced
+def find_duplicates(df, subset, col_name, group_ids=False, tolerance=None):
     
     """
     Main function that adds columns to a dataframe indicating
     if a subset of columns are duplicated. E.g., if the same
     latitude and longitude are found in multiple rows, the
     indices of those duplicate rows will be recorded as a list
-    in a column.
+    in a column. Rows are grouped by integer group codes (see
+    `duplicate_group_codes`); several subsets can be checked in
+    one call by passing lists of subsets and column names.
     
     df    (dataframe): dataframe to check for duplicates and add
                        columns to
     subset     (list): list of column names that will be checked
-                       for duplicate values
+                       for duplicate values, or a list of such lists
     col_name (string): column to create that stores a list of
-                       indices where values are duplicated
+                       indices where values are duplicated, or a
+                       list of such columns (one per subset)
+    group_ids  (bool): if True, store a compact integer group id
+                       (nullable Int64) instead of a list of indices
+    tolerance (float): optional distance (in the units of the subset
+                       columns) within which numeric values, e.g.
+                       coordinates, count as duplicates
     """
     
     df = df.copy()
-    if df.duplicated(subset=subset).any():
+    if isinstance(col_name, str):
+        subset, col_name = [subset], [col_name]
+    
+    labels = df.index.to_numpy()
+    for cols, name in zip(subset, col_name):
+        with span(f'find_duplicates:{name}', rows_in=len(df)) as info:
+            codes = duplicate_group_codes(df, cols, tolerance)
+            info['rows_out'] = int((codes >= 0).sum())
+        if not (codes >= 0).any():
+            print('no duplicates found')
+            continue
         print('duplicates found')
-        dupes = df.duplicated(subset=subset, keep=False)
-        dupe_groups = df[dupes].groupby(subset).apply(
-            lambda x: list(x.index)).reset_index(name='indices')
-        idx_to_dupes = {idx: indices for indices in dupe_groups['indices'] for idx in indices}
-        df[col_name] = df.index.map(idx_to_dupes)
-    else:
-        print('no duplicates found')
+        
+        # compact group ids
+        if group_ids:
+            df[name] = pd.array(np.where(codes >= 0, codes, None), dtype='Int64')
+            continue
+        
+        # lists of row indices, shared by every row of a group
+        rows = np.flatnonzero(codes >= 0)
+        rows = rows[np.argsort(codes[rows], kind='stable')]
+        starts = np.flatnonzero(np.r_[True, np.diff(codes[rows]) != 0])
+        groups = np.empty(len(starts), dtype=object)
+        for i, group in enumerate(np.split(labels[rows], starts[1:])):
+            groups[i] = group.tolist()
+        values = np.full(len(df), np.nan, dtype=object)
+        values[rows] = np.repeat(groups, np.diff(np.r_[starts, len(rows)]))
+        df[name] = values
     return df
 
+
+@traced
+def duplicate_group_codes(df, subset, tolerance=None):
+    
+    """
+    Main function that assigns every row that shares its subset values
+    with at least one other row a dense int64 group code (numbered in
+    order of first appearance); all other rows get -1. Rows with null
+    subset values are never duplicates. Exact duplicates are found by
+    factorizing the subset columns into one group code. With a
+    tolerance, rows whose subset values lie within that (euclidean)
+    distance of each other are linked with a KD-tree, and linked rows
+    form one group.
+    
+    df    (dataframe): dataframe to check for duplicates
+    subset     (list): list of column names to check
+    tolerance (float): optional distance for near duplicates
+    """
+    
+    if tolerance is None:
+        codes = df.groupby(subset, sort=False, dropna=True).ngroup()
+        codes = codes.fillna(-1).to_numpy(dtype=np.int64)
+    else:
+        from scipy.spatial import cKDTree
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+        values = df[subset].to_numpy(dtype=float)
+        valid = np.flatnonzero(~np.isnan(values).any(axis=1))
+        pairs = cKDTree(values[valid]).query_pairs(tolerance, output_type='ndarray')
+        graph = coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])),
+                           shape=(len(valid), len(valid)))
+        _, components = connected_components(graph, directed=False)
+        codes = np.full(len(df), -1, dtype=np.int64)
+        codes[valid] = components
+    
+    # keep groups with more than one row, renumbered densely
+    counts = np.bincount(codes[codes >= 0], minlength=1)
+    duplicated = (codes >= 0) & (counts[np.maximum(codes, 0)] > 1)
+    dense = np.full(len(df), -1, dtype=np.int64)
+    dense[duplicated] = pd.factorize(codes[duplicated])[0]
+    return dense
+
+    
+@traced
+def write_store_table(df, store_dir, table, source):
+    
+    """
+    Main function that writes one source's table to the columnar output
+    store as an Arrow IPC file partitioned by data source, i.e.
+    `store_dir/table/data_source=source/part-0.arrow`. Cover columns
+    (numeric columns whose name ends with 'cover') are stored as float32,
+    text columns (names, PFTs, subsources, ...) are dictionary encoded,
+    and the geometry of a GeoDataFrame is stored as WKB. A named index is
+    stored as a column. Returns the path to the written file.
+    
+    df    (dataframe): table to write, e.g. a source's standard PFT fcover
+    store_dir (string): path to the root directory of the store
+    table    (string): table name, e.g. 'standard_pft_fcover'
+    source   (string): datasource name, e.g. 'ava'
+    """
+    
+    import pyarrow as pa
+    arrow_table = to_store_arrow(df)
+    partition = os.path.join(store_dir, table, f'data_source={source}')
+    os.makedirs(partition, exist_ok=True)
+    
+    # write to a temporary file first so readers never see a partial file
+    path = os.path.join(partition, 'part-0.arrow')
+    with pa.OSFile(path + '.tmp', 'wb') as sink:
+        with pa.ipc.new_file(sink, arrow_table.schema) as writer:
+            writer.write_table(arrow_table)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+@traced
+def read_store_table(store_dir, table, sources=None, columns=None, index=None,
+                     keep_source=False, categories=True):
     
+    """
+    Main function that reads a table from the columnar output store (see
+    `write_store_table`) and concatenates its source partitions through
+    memory-mapped Arrow reads, without parsing any text. Sources with
+    different columns are combined on the union of their columns. Covers
+    are returned as float32, text columns as categoricals (or plain
+    objects), and a stored geometry as a GeoDataFrame.
+    
+    store_dir  (string): path to the root directory of the store
+    table      (string): table name, e.g. 'standard_pft_fcover'
+    sources      (list): optional datasource names to read (default all)
+    columns      (list): optional columns to read (default all)
+    index      (string): optional column to use as the index
+    keep_source  (bool): keep the 'data_source' partition column
+    categories   (bool): return text columns as categoricals; if False
+                         they are returned as plain object columns
+    """
+    
+    import pyarrow.dataset as ds
+    # read the requested sources and columns
+    dataset = store_dataset(store_dir, table)
+    schema = dataset.schema
+    row_filter = None
+    if sources is not None:
+        row_filter = ds.field('data_source').isin(list(sources))
+    if columns is not None:
+        columns = list(columns) + ([index] if index else [])
+        columns += ['data_source'] if keep_source else []
+        columns = [col for col in schema.names if col in columns]
+    arrow_table = dataset.to_table(columns=columns, filter=row_filter)
+    return from_store_arrow(arrow_table, index=index, keep_source=keep_source,
+                            categories=categories)
+
+
+def iter_store_table(store_dir, table, sources=None, columns=None, categories=True,
+                     batch_rows=1 << 20):
+    
+    """
+    Main function that reads a table from the columnar output store (see
+    `write_store_table`) one memory-mapped batch at a time, yielding a
+    dataframe per batch (see `read_store_table`), so tables larger than
+    memory can be reduced chunk by chunk, e.g. to their distinct species
+    names.
+    
+    store_dir  (string): path to the root directory of the store
+    table      (string): table name, e.g. 'harmonized_nonstandard_species_fcover'
+    sources      (list): optional datasource names to read (default all)
+    columns      (list): optional columns to read (default all)
+    categories   (bool): return text columns as categoricals
+    batch_rows    (int): maximum number of rows per dataframe
+    """
+    
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    dataset = store_dataset(store_dir, table)
+    row_filter = None
+    if sources is not None:
+        row_filter = ds.field('data_source').isin(list(sources))
+    if columns is not None:
+        columns = [col for col in dataset.schema.names if col in columns]
+    for batch in dataset.to_batches(columns=columns, filter=row_filter, batch_size=batch_rows):
+        yield from_store_arrow(pa.Table.from_batches([batch]), categories=categories)
+
+
+@traced
+def harmonize_store_table(store_dir, table, sources=None, index=None, index_name='unit_id',
+                          categories=True, rebuild=False, read=True):
+    
+    """
+    Main function that harmonizes a table of the columnar output store
+    (see `write_store_table`) incrementally: column names are converted
+    with `camel_to_snake` and empty strings/None are normalized to NaN
+    for each source partition, and the result is kept in the store as
+    'harmonized_<table>'. A manifest (`store_dir/manifest.json`) records
+    the content hash and row count of each source's input, so only the
+    partitions that changed (or are new) are rebuilt; partitions of
+    sources that were removed from the store are dropped. Returns the
+    concatenated harmonized table (see `read_store_table`), unless `read`
+    is False.
+    
+    store_dir  (string): path to the root directory of the store
+    table      (string): table name, e.g. 'standard_pft_fcover'
+    sources      (list): optional datasource names to return (default all)
+    index      (string): optional stored column to use as the index
+    index_name (string): name of the harmonized index
+    categories   (bool): return text columns as categoricals
+    rebuild      (bool): rebuild every partition regardless of the manifest
+    read         (bool): read and return the harmonized table; if False only
+                         the store is updated (e.g. for tables larger than
+                         memory, see `iter_store_table`) and None is returned
+    """
+    
+    # load the manifest and find the table's source partitions
+    manifest_path = os.path.join(store_dir, 'manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+    entries = manifest.setdefault(table, {})
+    harmonized = f'harmonized_{table}'
+    partitions = store_partitions(store_dir, table)
+    missing = set(sources or []) - set(partitions)
+    if missing:
+        raise FileNotFoundError(f'no {table} partition for {sorted(missing)} in {store_dir}')
+    
+    # drop harmonized partitions of sources that were removed
+    for source in sorted(set(entries) - set(partitions)):
+        shutil.rmtree(os.path.join(store_dir, harmonized, f'data_source={source}'),
+                      ignore_errors=True)
+        del entries[source]
+    
+    # rebuild partitions whose inputs changed
+    for source, path in partitions.items():
+        entry = {'hash': file_hash(path), 'rows': count_arrow_rows(path),
+                 'version': __version__}
+        output = os.path.join(store_dir, harmonized, f'data_source={source}', 'part-0.arrow')
+        if not rebuild and entries.get(source) == entry and os.path.exists(output):
+            continue
+        with span(f'harmonize_store_table:{source}', rows_in=entry['rows']):
+            df = from_store_arrow(read_arrow_file(path), index=index, categories=False)
+            df = harmonize_partition(df, index_name if index else None)
+            write_store_table(df, store_dir, harmonized, source)
+        entries[source] = entry
+        print(f'harmonized {table} for {source} ({entry["rows"]} rows)')
+    
+    # save the manifest atomically
+    with open(manifest_path + '.tmp', 'w') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    
+    if not read:
+        return None
+    return read_store_table(store_dir, harmonized, sources=sources,
+                            index=index_name if index else None,
+                            categories=categories)
+
+
+@traced
+def stream_species_fcover(store_dir, lookup, out_path, 
+                          table='harmonized_nonstandard_species_fcover', sources=None,
+                          name_map=None, unit_ids=None, memory_limit=1 << 30, tmp_dir=None):
+    
+    """
+    Main function that builds the standard species fcover table from a
+    harmonized species fcover table of the columnar output store without
+    holding the observations in memory. Observations are streamed in
+    chunks: dataset species names are replaced with `name_map` (e.g. the
+    adjudicated names), joined to their accepted names in `lookup`, and
+    spilled to temporary files that each hold a range of unit_ids. Each
+    range is then deduplicated, accepted names of rank 'type' are
+    lowercased, and covers are summed per unit_id and accepted species
+    name before the range is appended to `out_path` (csv, utf-8-sig). Rows
+    are written sorted by unit_id and accepted species name. Chunk sizes
+    and the number of ranges follow from `memory_limit`; the rows of one
+    unit_id are never split. Returns the number of rows written.
+    
+    store_dir    (string): path to the root directory of the store
+    lookup    (dataframe): 'dataset_species_name' with its 'accepted_species_name',
+                           'accepted_species_name_author' and 'taxon_rank'
+    out_path     (string): path to the output csv
+    table        (string): store table with 'unit_id', 'dataset_species_name' and
+                           'percent_cover' columns
+    sources        (list): optional datasource names to read (default all)
+    name_map       (dict): optional replacements for dataset species names
+    unit_ids       (list): optional unit_ids to keep (default all)
+    memory_limit    (int): approximate ceiling in bytes on the rows held in memory
+    tmp_dir      (string): optional directory for the spill files
+    """
+    
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    columns = ['unit_id', 'dataset_species_name', 'percent_cover']
+    dataset = store_dataset(store_dir, table)
+    row_filter = None
+    if sources is not None:
+        row_filter = ds.field('data_source').isin(list(sources))
+    lookup = lookup[['dataset_species_name', 'accepted_species_name',
+                     'accepted_species_name_author', 'taxon_rank']].drop_duplicates()
+    keep = None
+    if unit_ids is not None:
+        keep = pd.Index(pd.unique(np.asarray(unit_ids, dtype=object)))
+    
+    # first pass over the names only: rows per unit_id and bytes per row
+    counts, nbytes = [], 0
+    with span('stream_species_fcover:count') as info:
+        for batch in dataset.to_batches(columns=columns[:2], filter=row_filter):
+            df = from_store_arrow(pa.Table.from_batches([batch]), categories=False)
+            df = df[df['unit_id'].notna() if keep is None else df['unit_id'].isin(keep)]
+            counts.append(df['unit_id'].value_counts())
+            nbytes += df.memory_usage(deep=True, index=False).sum()
+        counts = pd.concat(counts).groupby(level=0).sum() if counts else pd.Series(dtype=int)
+        total = int(counts.sum())
+        info['rows_out'] = total
+    
+    # the join about doubles a row and a chunk is copied by the join,
+    # the deduplication and the groupby, hence 8x the name columns;
+    # sorted unit_ids are cut into ranges of about one chunk of rows
+    row_bytes = max(8 * nbytes / max(total, 1), 1)
+    chunk_rows = max(int(memory_limit // row_bytes), 1)
+    n_ranges = max(-(-total // chunk_rows), 1)
+    starts = counts.cumsum().to_numpy() - counts.to_numpy()
+    ranges = np.minimum(starts // chunk_rows, n_ranges - 1)
+    
+    # second pass: map and join chunks and spill them to their ranges
+    schema = pa.schema([('unit_id', pa.string()), ('dataset_species_name', pa.string()),
+                        ('percent_cover', dataset.schema.field('percent_cover').type),
+                        ('accepted_species_name', pa.string()),
+                        ('accepted_species_name_author', pa.string()),
+                        ('taxon_rank', pa.string())])
+    rows = 0
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as tmp:
+        batches = dataset.to_batches(columns=columns, filter=row_filter, batch_size=chunk_rows)
+        with span('stream_species_fcover:spill', rows_in=total, ranges=n_ranges):
+            for i, batch in enumerate(batches):
+                df = from_store_arrow(pa.Table.from_batches([batch]), categories=False)
+                df = df[df['unit_id'].isin(counts.index)]
+                if df.empty:
+                    continue
+                if name_map:
+                    df['dataset_species_name'] = replace_names(df['dataset_species_name'],
+                                                               name_map)
+                df = df.merge(lookup, on='dataset_species_name', how='left')
+                spill_unit_ranges(df, ranges[counts.index.get_indexer(df['unit_id'])], 
+                                  tmp, f'chunk-{i:08d}', schema)
+        
+        # reduce each range and append it to the output
+        with span('stream_species_fcover:reduce', rows_in=total) as info:
+            with open(out_path + '.tmp', 'w', encoding='utf-8-sig', newline='') as file:
+                for r in range(n_ranges):
+                    paths = sorted(glob.glob(os.path.join(tmp, f'range-{r}', '*.arrow')))
+                    if not paths and (rows or r < n_ranges - 1):
+                        continue
+                    tables = [read_arrow_stream(path) for path in paths] or [schema.empty_table()]
+                    df = reduce_species_range(pa.concat_tables(tables).to_pandas())
+                    df.to_csv(file, header=(rows == 0))
+                    rows += len(df)
+            info['rows_out'] = rows
+    os.replace(out_path + '.tmp', out_path)
+    return rows
+
+
+@traced
+def build_species_checklist(species_fcover, species_map, name_map=None):
+    
+    """
+    Main function that builds the species PFT checklist: one row per
+    dataset species name with its first non-null accepted name, naming
+    authority, PFT and nonstandard PFT. The plots each species was observed
+    in are returned as a separate edge table (one row per unique species
+    and unit_id pair, in order of first observation) instead of a list
+    column, so they never have to be written out and re-parsed. The
+    species fcover can be given in chunks (see `iter_store_table`); each
+    chunk is reduced to its unique pairs before the next one is read.
+    Returns (checklist, edges).
+    
+    species_fcover (dataframe): species fcover with 'unit_id', 'dataset_species_name',
+                                'pft' and 'nonstandard_pft' columns, or an
+                                iterable of such dataframes
+    species_map    (dataframe): 'dataset_species_name' with its manually assigned
+                                'accepted_species_name' and 'naming_authority'
+    name_map            (dict): optional replacements for dataset species names
+    """
+    
+    if isinstance(species_fcover, pd.DataFrame):
+        species_fcover = [species_fcover]
+    
+    # species <-> unit membership and first non-null values per chunk
+    edges, names = [], []
+    for chunk in species_fcover:
+        if name_map:
+            chunk = chunk.assign(dataset_species_name=replace_names(chunk['dataset_species_name'],
+                                                                    name_map))
+        chunk = chunk[chunk['dataset_species_name'].notna()]
+        edges.append(chunk[['dataset_species_name', 'unit_id']].drop_duplicates())
+        names.append(chunk.groupby('dataset_species_name', observed=True)
+                     [['pft', 'nonstandard_pft']].first())
+    edges = pd.concat(edges).drop_duplicates(ignore_index=True)
+    
+    # first non-null value per species name
+    names = pd.concat(names).groupby(level=0).first()
+    names.index.name = 'dataset_species_name'
+    accepted = (species_map.groupby('dataset_species_name')
+                [['accepted_species_name', 'naming_authority']].first())
+    checklist = names.join(accepted).reset_index()
+    checklist = checklist[['accepted_species_name', 'dataset_species_name', 
+                           'naming_authority', 'pft', 'nonstandard_pft']]
+    return checklist, edges
+
+
+@traced
+def add_checklist_columns(checklist, akveg_checklist):
+    
+    """
+    Main function that adds the AKVEG checklist's taxon rank (first 'Level'),
+    categories and habits to a species checklist (see
+    `build_species_checklist`) by accepted species name. A name's distinct
+    categories and habits are joined in sorted order as comma-separated
+    strings; names without any are NaN.
+    
+    checklist       (dataframe): species checklist with 'accepted_species_name'
+    akveg_checklist (dataframe): AKVEG checklist with 'Accepted Name', 'Category',
+                                 'Habit' and 'Level' columns
+    """
+    
+    names = akveg_checklist['Accepted Name']
+    taxa = akveg_checklist.groupby('Accepted Name')[['Level']].first()
+    taxa['category'] = join_unique(names, akveg_checklist['Category'])
+    taxa['habit'] = join_unique(names, akveg_checklist['Habit'])
+    taxa = taxa.rename(columns={'Level': 'taxon_rank'})
+    checklist = checklist.merge(taxa, left_on='accepted_species_name', right_index=True,
+                                how='left')
+    return checklist[['accepted_species_name', 'dataset_species_name', 'taxon_rank',
+                      'naming_authority', 'category', 'habit', 'pft', 'nonstandard_pft']]
+
+
+@traced
+def validate_cover(df, rules=COVER_RULES, tolerance=0.01, chunk_rows=1 << 20):
+
+    """
+    Main function that checks a standard PFT fcover, species fcover, or
+    plot information table against a declarative rule set (see
+    `COVER_RULES`), e.g. non-negative covers, non-vascular cover equal to
+    bryophyte plus lichen cover, top cover non-vegetation of at most 100
+    percent, and standard trace values. Each chunk of rows is converted
+    to NumPy arrays once and every rule is evaluated on them as an array
+    expression. Returns one row per violation: the row's index label
+    ('row'), the rule 'code', the 'column' (or summed columns) and the
+    offending 'value' (for sums, the difference from the right-hand side).
+
+    df   (dataframe): table to check, with camelCase or snake_case columns
+    rules     (list): (code, check, columns, argument) rules
+    tolerance (float): allowed difference for 'sum' rules, e.g. float32 rounding
+    chunk_rows  (int): rows checked at a time
+    """
+
+    violations = []
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        for pos, code, column, value in rule_violations(chunk, rules, tolerance):
+            violations.append(violation_frame(chunk.index[pos], code, column, value))
+    return concat_violations(violations, rules)
+
+
+@traced
+def validate_store_table(store_dir, table, sources=None, index=None, rules=COVER_RULES,
+                         tolerance=0.01, batch_rows=1 << 20):
+
+    """
+    Main function that checks a table of the columnar output store (see
+    `write_store_table`), e.g. 'standard_pft_fcover' or its harmonized
+    version, with `validate_cover`. Only the columns the rules need are
+    read, one memory-mapped batch at a time, so the whole harmonized
+    database can be checked on every run. Returns the violations with
+    their 'data_source'.
+
+    store_dir (string): path to the root directory of the store
+    table     (string): table name, e.g. 'harmonized_plot_info'
+    sources     (list): optional datasource names to check (default all)
+    index     (string): column identifying the rows (default 'unit_id' or
+                        'plotName', whichever is stored)
+    rules       (list): (code, check, columns, argument) rules
+    tolerance  (float): allowed difference for 'sum' rules
+    batch_rows   (int): rows read and checked at a time
+    """
+
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    # read only the row identifier and the columns the rules use
+    dataset = store_dataset(store_dir, table)
+    names = dataset.schema.names
+    if index is None:
+        index = next((name for name in ['unit_id', 'plotName'] if name in names), None)
+    columns = {resolve_column(names, col) for _, _, cols, _ in rules for col in cols}
+    for _, check, _, argument in rules:
+        if check == 'sum' and isinstance(argument[1], str):
+            columns.add(resolve_column(names, argument[1]))
+    columns = [name for name in names if name in columns | {index, 'data_source'}]
+    row_filter = None
+    if sources is not None:
+        row_filter = ds.field('data_source').isin(list(sources))
+
+    violations = []
+    for batch in dataset.to_batches(columns=columns, filter=row_filter, batch_size=batch_rows):
+        chunk = from_store_arrow(pa.Table.from_batches([batch]), index=index,
+                                 keep_source=True)
+        for pos, code, column, value in rule_violations(chunk, rules, tolerance):
+            frame = violation_frame(chunk.index[pos], code, column, value)
+            frame.insert(0, 'data_source', chunk['data_source'].to_numpy()[pos])
+            violations.append(frame)
+    violations = concat_violations(violations, rules)
+    if 'data_source' not in violations.columns:
+        violations.insert(0, 'data_source', pd.Series(dtype=object))
+    violations['data_source'] = violations['data_source'].astype('category')
+    return violations
+
+
+##########################################################################################
+# Instrumentation functions used by `span` and `traced`
+##########################################################################################
+
+# function to time one phase while instrumentation is on and emit its
+# event to the tracer's sink; the peak traced memory of a phase includes
+# the peaks of the phases nested in it
+@contextmanager
+def trace_span(name, rows_in, args):
+
+    tracer = TRACER
+    info = dict(args)
+    if rows_in is not None:
+        info['rows_in'] = rows_in
+    frame = {'peak': 0}
+    if tracer['trace_memory']:
+        current, peak = tracemalloc.get_traced_memory()
+        if tracer['stack']:
+            parent = tracer['stack'][-1]
+            parent['peak'] = max(parent['peak'], peak)
+        frame = {'start': current, 'peak': current}
+        tracemalloc.reset_peak()
+    tracer['stack'].append(frame)
+    start = time.perf_counter_ns()
+    try:
+        yield info
+    finally:
+        duration = time.perf_counter_ns() - start
+        tracer['stack'].pop()
+        if tracer['trace_memory']:
+            peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            info['peak_traced_bytes'] = peak - frame['start']
+            if tracer['stack']:
+                parent = tracer['stack'][-1]
+                parent['peak'] = max(parent['peak'], peak)
+        info['max_rss_bytes'] = max_rss_bytes()
+        tracer['sink']({'name': name, 'cat': 'spf', 'ph': 'X',
+                        'ts': start // 1000, 'dur': duration // 1000,
+                        'pid': os.getpid(), 'tid': threading.get_ident(),
+                        'args': info})
+
+
+# function to count the rows of a dataframe, series, or array (None for
+# anything else)
+def count_rows(obj):
+
+    if isinstance(obj, (pd.DataFrame, pd.Series, np.ndarray)):
+        return len(obj)
+    return None
+
+
+# function to get the peak resident set size of this process in bytes
+# (None where the resource module is not available)
+def max_rss_bytes():
+
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+##########################################################################################
+# Parallel spatial join functions used by `add_geospatial_aux`
+##########################################################################################
+
+# layer trees loaded by worker processes, keyed by WKB store prefix
+LAYER_TREES = {}
+
+
+# function to split points into spatially coherent chunks and query a
+# layer in a process pool; returns (point position, polygon position)
+def parallel_layer_query(points, layer, pool, prefix, n_chunks):
+
+    # workers memory-map the layer instead of receiving it with every task
+    write_wkb_store(layer.geometry.values, prefix)
+
+    # order points along a hilbert curve so chunks are spatially compact
+    import shapely
+    geoms = points.geometry.values
+    order = np.argsort(points.geometry.hilbert_distance().to_numpy(), kind='stable')
+    chunks = [c for c in np.array_split(order, min(n_chunks, len(order))) if len(c)]
+    futures = [pool.submit(query_layer_chunk, prefix, shapely.to_wkb(geoms[c]), c)
+               for c in chunks]
+    results = [future.result() for future in futures]
+    point_pos = np.concatenate([r[0] for r in results])
+    layer_pos = np.concatenate([r[1] for r in results])
+    return point_pos, layer_pos
+
+
+# function to write geometries as one flat WKB byte array plus offsets
+def write_wkb_store(geoms, prefix):
+
+    import shapely
+    wkb = shapely.to_wkb(np.asarray(geoms))
+    lengths = np.fromiter((len(w) for w in wkb), dtype=np.int64, count=len(wkb))
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    np.save(f'{prefix}.offsets.npy', offsets)
+    np.save(f'{prefix}.wkb.npy', np.frombuffer(b''.join(wkb), dtype=np.uint8))
+    return prefix
+
+
+# worker function: load (once per process) the memory-mapped layer and
+# query it with a chunk of points given as WKB and global positions
+def query_layer_chunk(prefix, chunk_wkb, positions):
+
+    import shapely
+    if prefix not in LAYER_TREES:
+        blob = np.load(f'{prefix}.wkb.npy', mmap_mode='r')
+        offsets = np.load(f'{prefix}.offsets.npy')
+        wkb = [blob[a:b].tobytes() for a, b in zip(offsets[:-1], offsets[1:])]
+        LAYER_TREES[prefix] = shapely.STRtree(shapely.from_wkb(wkb))
+    tree = LAYER_TREES[prefix]
+    chunk_pos, layer_pos = tree.query(shapely.from_wkb(chunk_wkb),
+                                      predicate='intersects')
+    return positions[chunk_pos], layer_pos
+
+
+# function to build the same left join as gpd.sjoin(how='left') from
+# (point position, polygon position) pairs
+def join_layer_pairs(left, right, pairs, rsuffix):
+
+    # sort pairs by point, keeping the tree's hit order within a point
+    # (as sjoin does), and insert unmatched points
+    l_idx, r_idx = (np.asarray(p, dtype=np.intp) for p in pairs)
+    order = np.argsort(l_idx, kind='stable')
+    l_idx, r_idx = l_idx[order], r_idx[order]
+    positions = np.arange(len(left))
+    missing = positions[~np.isin(positions, l_idx)]
+    insert = np.searchsorted(l_idx, missing)
+    l_idx = np.insert(l_idx, insert, missing)
+    r_idx = np.insert(r_idx, insert, -1)
+
+    # right columns; -1 is not a label of the range index, giving NaN rows
+    right_df = pd.DataFrame(right.drop(columns=right.geometry.name))
+    index_name = right_df.index.name or f'index_{rsuffix}'
+    right_df = right_df.reset_index(names=index_name)
+    right_part = right_df.reindex(r_idx)
+
+    # left rows keep their index labels
+    left_part = left.iloc[l_idx]
+    right_part.index = left_part.index
+    joined = pd.concat([left_part, right_part], axis=1)
+    import geopandas as gpd
+    return gpd.GeoDataFrame(joined, geometry=left.geometry.name, crs=left.crs)
+
+
+##########################################################################################
+# Columnar output store functions used by `write_store_table` and `read_store_table`
+##########################################################################################
+
+# function to convert a (geo)dataframe to the store's Arrow encoding
+def to_store_arrow(df):
+
+    import pyarrow as pa
+    # keep a named index as a column
+    if any(name is not None for name in df.index.names):
+        df = df.reset_index()
+    
+    # geometry as WKB, described by geoparquet-style metadata; a
+    # GeoDataFrame can only exist if geopandas was already imported
+    geo = None
+    gpd = sys.modules.get('geopandas')
+    if gpd is not None and isinstance(df, gpd.GeoDataFrame):
+        import shapely
+        col = df.geometry.name
+        geo = {'primary_column': col,
+               'columns': {col: {'encoding': 'WKB',
+                                 'crs': df.crs.to_string() if df.crs else None}}}
+        df = pd.DataFrame(df)
+        df[col] = shapely.to_wkb(df[col].to_numpy())
+    else:
+        df = df.copy()
+    
+    # float32 covers and dictionary-encoded text
+    for col in df.columns:
+        values = df[col]
+        if (str(col).lower().endswith('cover') and pd.api.types.is_numeric_dtype(values)
+                and not pd.api.types.is_bool_dtype(values)):
+            df[col] = values.to_numpy(dtype=np.float32, na_value=np.nan)
+        elif values.dtype == object or pd.api.types.is_string_dtype(values):
+            inferred = pd.api.types.infer_dtype(values, skipna=True)
+            if inferred.startswith('mixed'):
+                values = values.where(values.isna(), values.astype(str))
+                inferred = 'string'
+            if inferred == 'string':
+                df[col] = values.astype('category')
+    
+    arrow_table = pa.Table.from_pandas(df, preserve_index=False)
+    
+    # columns without any value (e.g. flags that no plot of a source has)
+    # are written as null, which unifies with the type of other sources
+    for i, column in enumerate(arrow_table.columns):
+        if len(column) and column.null_count == len(column):
+            field = arrow_table.schema.field(i).with_type(pa.null())
+            arrow_table = arrow_table.set_column(i, field, pa.nulls(len(column)))
+    if geo is not None:
+        metadata = dict(arrow_table.schema.metadata or {})
+        metadata[b'geo'] = json.dumps(geo).encode()
+        arrow_table = arrow_table.replace_schema_metadata(metadata)
+    return arrow_table
+
+
+# function to convert a table read from the store back to a (geo)dataframe
+def from_store_arrow(arrow_table, index=None, keep_source=False, categories=True):
+
+    import pyarrow as pa
+    # decode dictionary columns unless categoricals are wanted
+    metadata = arrow_table.schema.metadata or {}
+    if not categories:
+        for i, field in enumerate(arrow_table.schema):
+            if pa.types.is_dictionary(field.type):
+                column = arrow_table.column(i).cast(field.type.value_type)
+                arrow_table = arrow_table.set_column(i, field.name, column)
+    df = arrow_table.to_pandas()
+    if not keep_source and 'data_source' in df.columns:
+        df = df.drop(columns='data_source')
+    if index is not None:
+        df = df.set_index(index)
+    
+    # rebuild the geometry from WKB
+    if b'geo' in metadata:
+        geo = json.loads(metadata[b'geo'])
+        col = geo['primary_column']
+        if col in df.columns:
+            import geopandas as gpd
+            df[col] = gpd.GeoSeries.from_wkb(df[col].to_numpy(), index=df.index,
+                                             crs=geo['columns'][col]['crs'])
+            df = gpd.GeoDataFrame(df, geometry=col)
+    return df
+
+
+# function to open a store table as one memory-mapped dataset over the
+# union of its partitions' schemas
+def store_dataset(store_dir, table):
+
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.fs as pafs
+    path = os.path.join(store_dir, table)
+    options = dict(format='ipc', filesystem=pafs.LocalFileSystem(use_mmap=True),
+                   partitioning=ds.HivePartitioning.discover(infer_dictionary=True))
+    dataset = ds.dataset(path, **options)
+    schemas = [fragment.physical_schema for fragment in dataset.get_fragments()]
+    schema = pa.unify_schemas(schemas + [dataset.partitioning.schema],
+                              promote_options='permissive')
+    return ds.dataset(path, schema=schema, **options)
+
+
+# function to replace names in a series with a dictionary, only looking
+# up each unique name once
+def replace_names(names, name_map):
+
+    codes, uniques = pd.factorize(names, use_na_sentinel=False)
+    uniques = pd.Series(uniques, dtype=object).replace(name_map).to_numpy(dtype=object)
+    return pd.Series(uniques[codes], index=names.index, name=names.name)
+
+
+# function to append the rows of a chunk to the spill files of their
+# unit_id ranges (`tmp/range-<r>/<name>.arrow`)
+def spill_unit_ranges(df, ranges, tmp, name, schema):
+
+    import pyarrow as pa
+    order = np.argsort(ranges, kind='stable')
+    df, ranges = df.iloc[order], ranges[order]
+    bounds = np.flatnonzero(np.diff(ranges)) + 1
+    for part in np.split(np.arange(len(df)), bounds):
+        directory = os.path.join(tmp, f'range-{ranges[part[0]]}')
+        os.makedirs(directory, exist_ok=True)
+        table = pa.Table.from_pandas(df.iloc[part], schema=schema, preserve_index=False)
+        with pa.OSFile(os.path.join(directory, f'{name}.arrow'), 'wb') as sink:
+            with pa.ipc.new_stream(sink, schema) as writer:
+                writer.write_table(table)
+
+
+# function to read one Arrow IPC stream file through a memory map
+def read_arrow_stream(path):
+
+    import pyarrow as pa
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_stream(source).read_all()
+
+
+# function to deduplicate one unit_id range of joined species fcover,
+# lowercase accepted names of rank 'type', and sum the cover per
+# unit_id and accepted species name
+def reduce_species_range(df):
+
+    df = df.drop_duplicates()
+    types = (df['taxon_rank'] == 'type') & df['accepted_species_name'].notna()
+    df.loc[types, 'accepted_species_name'] = (df.loc[types, 'accepted_species_name']
+                                              .str.lower().str.strip())
+    df = df.groupby(['unit_id', 'accepted_species_name'], as_index=False)['percent_cover'].sum()
+    df = df.rename(columns={'percent_cover': 'fcover'}).set_index('unit_id')
+    return df.replace({None: np.nan, '': np.nan, -999: np.nan})
+
+
+# function to find the partition file of each source of a store table
+def store_partitions(store_dir, table):
+
+    partitions = {}
+    pattern = os.path.join(glob.escape(os.path.join(store_dir, table)),
+                           'data_source=*', 'part-0.arrow')
+    for path in sorted(glob.glob(pattern)):
+        source = os.path.basename(os.path.dirname(path)).split('=', 1)[1]
+        partitions[source] = path
+    return partitions
+
+
+# function to read one Arrow IPC file through a memory map
+def read_arrow_file(path):
+
+    import pyarrow as pa
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+# function to count the rows of an Arrow IPC file without reading its data
+def count_arrow_rows(path):
+
+    import pyarrow as pa
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+
+
+# function to convert camelCase column names to snake_case for ESS-Dive
+def camel_to_snake(name):
+
+    import regex as re
+    name = re.sub('(.)([A-Z][a-z]+)', r'\1_\2', name)
+    name = re.sub('([a-z0-9])([A-Z])', r'\1_\2', name)
+    return name.lower()
+
+
+# function to harmonize one source partition: snake_case column names,
+# a standard index name, and NaN for empty strings and None
+def harmonize_partition(df, index_name=None):
+
+    df = df.rename(columns=camel_to_snake)
+    if index_name is not None:
+        df.index.name = index_name
+    for col in df.columns:
+        if df[col].dtype == object:
+            values = df[col]
+            df[col] = values.where(values.notna() & (values != ''), np.nan)
+    return df
+
+
+##########################################################################################
+# Validation functions used by `validate_cover` and `validate_store_table`
+##########################################################################################
+
+# comparisons of a 'sum' rule: (sum - right-hand side, tolerance) -> violation
+SUM_COMPARISONS = {'==': lambda diff, tol: np.abs(diff) > tol,
+                   '<=': lambda diff, tol: diff > tol,
+                   '>=': lambda diff, tol: diff < -tol}
+
+
+# function to find a rule's (camelCase) column among the column names,
+# either as is or converted with `camel_to_snake`; None if it is missing
+def resolve_column(names, name):
+
+    if name in names:
+        return name
+    name = camel_to_snake(name)
+    return name if name in names else None
+
+
+# function to evaluate every rule on one chunk of a table; yields the
+# (positions, code, column, values) of each rule's violations. Every
+# column is converted to a float64 array only once per chunk
+def rule_violations(df, rules, tolerance):
+
+    arrays = {}
+    def values(col):
+        if col not in arrays:
+            try:
+                arrays[col] = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+            except (TypeError, ValueError):
+                arrays[col] = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64)
+        return arrays[col]
+
+    names = set(df.columns)
+    for code, check, columns, argument in rules:
+        cols = [resolve_column(names, col) for col in columns]
+        if check == 'sum':
+            op, rhs = argument
+            if isinstance(rhs, str):
+                rhs = resolve_column(names, rhs)
+                cols.append(rhs)
+            if None in cols:
+                continue
+            parts = cols[:len(columns)]
+            total = sum(np.nan_to_num(values(col)) for col in parts)
+            if isinstance(rhs, str):
+                diff = total - np.nan_to_num(values(rhs))
+            else:
+                diff = total - rhs
+            pos = np.flatnonzero(SUM_COMPARISONS[op](diff, tolerance))
+            yield pos, code, ' + '.join(parts), diff[pos]
+            continue
+        for col in cols:
+            if col is None:
+                continue
+            if check == 'not_null':
+                pos = np.flatnonzero(df[col].isna().to_numpy())
+                yield pos, code, col, np.full(len(pos), np.nan)
+                continue
+            value = values(col)
+            if check == 'range':
+                low, high = argument
+                bad = np.zeros(len(value), dtype=bool)
+                if low is not None:
+                    bad |= value < low
+                if high is not None:
+                    bad |= value > high
+            elif check == 'trace':
+                trace, upper = argument
+                bad = (value >= 0) & (value < upper)
+                candidates = np.flatnonzero(bad)
+                near = np.abs(value[candidates, None] - np.asarray(trace)) <= 1e-6
+                bad[candidates[near.any(axis=1)]] = False
+            else:
+                raise ValueError(f'unknown check {check!r} in rule {code!r}')
+            pos = np.flatnonzero(bad)
+            yield pos, code, col, value[pos]
+
+
+# function to build the violation table of one rule and chunk
+def violation_frame(rows, code, column, values):
+
+    return pd.DataFrame({'row': np.asarray(rows), 'code': code, 'column': column,
+                         'value': values})
+
+
+# function to concatenate violation tables, with the rule codes and
+# columns as categoricals
+def concat_violations(frames, rules):
+
+    frames = [frame for frame in frames if len(frame)]
+    if frames:
+        violations = pd.concat(frames, ignore_index=True)
+    else:
+        violations = pd.DataFrame({'row': pd.Series(dtype=object),
+                                   'code': pd.Series(dtype=object),
+                                   'column': pd.Series(dtype=object),
+                                   'value': pd.Series(dtype=np.float64)})
+    codes = list(dict.fromkeys(code for code, _, _, _ in rules))
+    violations['code'] = pd.Categorical(violations['code'], categories=codes)
+    violations['column'] = violations['column'].astype('category')
+    return violations
+
+
 ##########################################################################################
 # Pandas row-wise functions to use with .apply()
 ##########################################################################################
@@ -618,4 +2376,427 @@ def clean_shrub_habits(row):
     if 'shrub' in row:
         return 'shrub'
     else:
-        return row
\ No newline at end of file
+        return row
+
+##########################################################################################
+# Pandas series-wise (vectorized) functions
+##########################################################################################
+
+# function to get the first n words of every name in a series
+def get_first_words(series, n):
+
+    # split on whitespace, keep n words; empty/non-string names are null
+    words = series.str.split().str[:n].str.join(' ')
+    return words.replace('', np.nan)
+
+
+# function to get the genus-species join key of every name in a series;
+# vectorized equivalent of `get_substrings`
+def get_substring_keys(series):
+
+    # extract genus + species name
+    words = series.str.split()
+    first = words.str[0]
+    second = words.str[1]
+    keys = words.str[:2].str.join(' ')
+    keys = keys.where(~((first == 'Unknown') | (second == 'Unknown')), second)
+    keys = keys.where(~((first == 'species') | (second == 'species')), first)
+
+    # remove potential brackets in string; empty keys are null
+    keys = (keys
+            .str.replace('[', '', regex=False)
+            .str.replace(']', '', regex=False))
+    return keys.replace('', np.nan)
+
+
+# function to simplify every habit list that mentions a shrub to 'shrub';
+# vectorized equivalent of `clean_shrub_habits`
+def clean_shrub_habit_names(series):
+
+    habits = series.astype(object)
+    habits = habits.where(habits.str.len().notna())
+    return habits.mask(habits.str.contains('shrub', regex=False, na=False), 'shrub')
+
+
+# function to get the unique values of every key as lists (in order of
+# first appearance), indexed by the sorted keys
+def unique_lists(keys, values):
+
+    pairs = pd.DataFrame({'key': keys.to_numpy(), 'value': values.to_numpy()})
+    pairs = pairs[pairs['key'].notna()].drop_duplicates()
+    codes, uniques = pd.factorize(pairs['key'], sort=True)
+    index = pd.Index(uniques, name=keys.name)
+    if not len(codes):
+        return pd.Series([], index=index, name=values.name, dtype=object)
+    
+    # one stable sort by key, then split at the key boundaries
+    order = np.argsort(codes, kind='stable')
+    bounds = np.flatnonzero(np.diff(codes[order])) + 1
+    lists = [part.tolist() for part in np.split(pairs['value'].to_numpy()[order], bounds)]
+    return pd.Series(lists, index=index, name=values.name)
+
+
+# function to join the distinct non-null values of every key into one
+# sorted, comma-separated string, indexed by the sorted keys
+def join_unique(keys, values, sep=', '):
+
+    pairs = pd.DataFrame({'key': keys.to_numpy(), 'value': values.to_numpy()}).dropna()
+    pairs = pairs.drop_duplicates().sort_values(['key', 'value'])
+    joined = pairs.groupby('key')['value'].agg(sep.join)
+    joined.index.name = keys.name
+    return joined.rename(values.name)
+
+
+# function to split every name of an array into character n-grams after
+# lowercasing and collapsing whitespace; returns the name position and
+# the n-gram (its code points packed into one integer) of every n-gram,
+# plus the normalized names
+def name_grams(names, n):
+
+    normalized = (pd.Series(names, dtype=object).fillna('').astype(str)
+                  .str.lower().str.split().str.join(' ').to_numpy(dtype=object))
+    if not len(normalized):
+        return (np.array([], dtype=np.int64), np.array([], dtype=np.int64), normalized)
+    
+    # code points of the space-padded names as one 2d array
+    pad = ' ' * (n - 1)
+    padded = np.array([pad + name + pad for name in normalized], dtype=str)
+    width = padded.dtype.itemsize // 4
+    codes = padded.view(np.uint32).reshape(len(padded), width).astype(np.int64)
+    
+    # pack every window of n code points (21 bits each) into one integer
+    n_windows = width - n + 1
+    keys = np.zeros((len(padded), n_windows), dtype=np.int64)
+    for offset in range(n):
+        keys = (keys << 21) | codes[:, offset:offset + n_windows]
+    valid = np.arange(n_windows) <= (np.char.str_len(padded) - n)[:, None]
+    rows = np.nonzero(valid)[0]
+    return rows, keys[valid], normalized
+
+
+# function to get the Levenshtein (edit) distance of every pair of
+# strings in two equal-length arrays; pairs are processed in batches of
+# similar length, one dynamic programming row at a time for all pairs
+def levenshtein_distances(a, b, batch_size=4096):
+
+    a = np.asarray(a, dtype=str)
+    b = np.asarray(b, dtype=str)
+    distances = np.zeros(len(a), dtype=np.int64)
+    a_len, b_len = np.char.str_len(a), np.char.str_len(b)
+    order = np.argsort(np.maximum(a_len, b_len), kind='stable')
+    for start in range(0, len(a), batch_size):
+        batch = order[start:start + batch_size]
+        la, lb = a_len[batch], b_len[batch]
+        width_a, width_b = max(int(la.max()), 1), max(int(lb.max()), 1)
+        codes_a = np.array(a[batch], dtype=f'U{width_a}').view(np.uint32).reshape(-1, width_a)
+        codes_b = np.array(b[batch], dtype=f'U{width_b}').view(np.uint32).reshape(-1, width_b)
+        codes_b = np.where(np.arange(width_b) < lb[:, None], codes_b, np.uint32(0xFFFFFFFF))
+        
+        # row i of the table for all pairs; insertions are resolved with a
+        # running minimum along the row
+        cols = np.arange(width_b + 1)
+        prev = np.tile(cols, (len(batch), 1))
+        for i in range(1, int(la.max()) + 1):
+            cost = codes_a[:, i - 1:i] != codes_b
+            cur = np.empty_like(prev)
+            cur[:, 0] = i
+            cur[:, 1:] = np.minimum(prev[:, 1:] + 1, prev[:, :-1] + cost)
+            cur = np.minimum.accumulate(cur - cols, axis=1) + cols
+            prev = np.where((i <= la)[:, None], cur, prev)
+        distances[batch] = prev[np.arange(len(batch)), lb]
+    return distances
+
+
+# pattern for a decimal number as accepted by float(), e.g. '5', '2.5', '1e3'
+NUMBER_PATTERN = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+
+
+# function to parse plot dimensions like '5 radius' (circle) or '10x10'
+# (square or rectangle) into the standard plotShape and plotArea columns;
+# vectorized equivalent of the akveg `process_plot_dimensions`
+def parse_plot_dimensions(series):
+
+    # parse each unique dimension once; missing dimensions are null
+    codes, uniques = pd.factorize(series)
+    text = pd.Series(uniques, dtype=object).astype(str)
+    
+    # extract the radius or length and width
+    radius = text.str.extract(rf'^\s*({NUMBER_PATTERN})\s+radius', expand=False)
+    sides = text.str.extract(rf'^\s*({NUMBER_PATTERN})\s*x\s*({NUMBER_PATTERN})\s*(?:x.*)?$')
+    radius = radius.astype(float).to_numpy()
+    length = sides[0].astype(float).to_numpy()
+    width = sides[1].astype(float).to_numpy()
+    has_radius = text.str.contains('radius', regex=False).to_numpy(dtype=bool)
+    has_x = text.str.contains('x', regex=False).to_numpy(dtype=bool) & ~has_radius
+    other = ~has_radius & ~has_x
+    
+    # shapes: unparseable radii and unknown formats are 'unknown';
+    # unparseable LxW are null
+    shape = np.full(len(uniques) + 1, np.nan, dtype=object)
+    shape[:-1][has_radius] = np.where(np.isnan(radius[has_radius]), 'unknown', 'circle')
+    rectangle = has_x & ~np.isnan(length)
+    shape[:-1][rectangle] = np.where(length[rectangle] == width[rectangle],
+                                     'square', 'rectangle')
+    shape[:-1][other] = 'unknown'
+    
+    # areas: unknown formats keep their value if it is numeric
+    area = np.full(len(uniques) + 1, np.nan)
+    area[:-1] = np.where(has_radius, np.pi * radius ** 2, length * width)
+    area[:-1][other] = pd.to_numeric(pd.Series(uniques[other], dtype=object),
+                                     errors='coerce')
+    
+    # the last slot holds the result for missing dimensions (code -1)
+    return pd.DataFrame({'plotShape': shape[codes], 'plotArea': area[codes]},
+                        index=series.index)
+
+
+# function to parse integer dates as yyyymmdd, yyyymm or yyyy into the
+# standard surveyYear, surveyMonth and surveyDay columns; other values
+# are null; vectorized equivalent of the ava `extract_datetime`
+def parse_int_dates(series):
+
+    # integer part of each date; non-numeric dates are null
+    values = pd.to_numeric(series, errors='coerce').to_numpy(dtype=float)
+    values = np.trunc(values)
+    digits = np.select([(values >= 1e7) & (values < 1e8),
+                        (values >= 1e5) & (values < 1e6),
+                        (values >= 1e3) & (values < 1e4)], [8, 6, 4], 0)
+    
+    # split digits with integer arithmetic
+    ints = np.where(digits > 0, values, 0).astype(np.int64)
+    year = np.select([digits == 8, digits == 6, digits == 4],
+                     [ints // 10000, ints // 100, ints])
+    month = np.select([digits == 8, digits == 6], [ints // 100 % 100, ints % 100])
+    day = ints % 100
+    dates = pd.DataFrame({'surveyYear': pd.array(year, dtype='Int64'),
+                          'surveyMonth': pd.array(month, dtype='Int64'),
+                          'surveyDay': pd.array(day, dtype='Int64')},
+                         index=series.index)
+    dates['surveyYear'] = dates['surveyYear'].mask(digits == 0)
+    dates['surveyMonth'] = dates['surveyMonth'].mask(digits < 6)
+    dates['surveyDay'] = dates['surveyDay'].mask(digits < 8)
+    return dates
+
+
+##########################################################################################
+# File and cache helper functions
+##########################################################################################
+
+# function to write a file atomically: `write` is called with a unique
+# temporary path in the same directory, which then replaces `path`, so
+# concurrent readers (e.g. parallel pipeline sources sharing a cache)
+# never see a partially written file
+def write_atomic(write, path):
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.tmp-',
+                               suffix='-' + os.path.basename(path))
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return path
+
+
+# function to remove the cache files matching a glob pattern, except the
+# files of the current cache key; files that another process already
+# removed are skipped
+def remove_stale_cache(cache_dir, pattern, key):
+
+    for stale in glob.glob(os.path.join(glob.escape(cache_dir), pattern)):
+        if os.path.basename(stale).startswith(key + '.'):
+            continue
+        try:
+            os.remove(stale)
+        except FileNotFoundError:
+            pass
+
+
+# function to get the sha256 hex digest of a file's contents
+def file_hash(path, blocksize=1 << 20):
+
+    # read in blocks so large files are not loaded into memory
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(blocksize), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# function to make sure a (manually edited) text file is utf-8 with a
+# byte order mark, without parsing it; the file is only rewritten if needed
+def ensure_utf8_sig(path):
+
+    with open(path, 'rb') as file:
+        if file.read(len(codecs.BOM_UTF8)) == codecs.BOM_UTF8:
+            return
+    
+    # copy the text in blocks with the encodings detected from a sample;
+    # the next candidate is only tried if decoding fails
+    candidates = encoding_candidates(path)
+    for i, encoding in enumerate(candidates):
+        try:
+            with open(path, encoding=encoding, newline='') as source, \
+                    open(path + '.tmp', 'w', encoding='utf-8-sig', newline='') as file:
+                shutil.copyfileobj(source, file)
+            break
+        except UnicodeDecodeError:
+            if i == len(candidates) - 1:
+                raise
+    os.replace(path + '.tmp', path)
+
+
+# function to get the sha256 hex digest of a (possibly multi-file)
+# geospatial layer, e.g. a shapefile's .shp, .dbf, .shx and .prj
+def layer_hash(path):
+
+    # hash every file that shares the layer's stem, in a fixed order
+    digest = hashlib.sha256()
+    for part in layer_files(path):
+        digest.update(os.path.basename(part).encode())
+        digest.update(file_hash(part).encode())
+    return digest.hexdigest()
+
+
+# function to get the files of a layer (e.g. the .shp, .dbf, .shx and .prj
+# of a shapefile), i.e. every file that shares the layer's stem
+def layer_files(path):
+
+    stem = os.path.splitext(path)[0]
+    return sorted(set(glob.glob(glob.escape(stem) + '.*')) | {path})
+
+
+# function to get a cheap signature of a layer's files (names, modification
+# times and sizes) that changes whenever one of them is rewritten
+def layer_signature(path):
+
+    stats = [(part, os.stat(part)) for part in layer_files(path)]
+    return tuple((os.path.basename(part), stat.st_mtime_ns, stat.st_size)
+                 for part, stat in stats)
+
+
+# function to serialize a name index (see `build_name_index`) as one
+# uncompressed .npz file, without pickled objects
+def save_name_index(index, path):
+
+    matrix = index['matrix']
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    def write(tmp):
+        with open(tmp, 'wb') as file:
+            np.savez(file, names=index['names'].astype(str),
+                     normalized=index['normalized'].astype(str), grams=index['grams'],
+                     indptr=matrix.indptr, indices=matrix.indices, n=index['n'])
+    return write_atomic(write, path)
+
+
+# function to load a name index written by `save_name_index`
+def load_name_index(path):
+
+    with np.load(path, allow_pickle=False) as data:
+        names, normalized = data['names'].astype(object), data['normalized'].astype(object)
+        grams, indptr, indices = data['grams'], data['indptr'], data['indices']
+        n = int(data['n'])
+    from scipy.sparse import csr_matrix
+    matrix = csr_matrix((np.ones(len(indices), dtype=np.float32), indices, indptr),
+                        shape=(len(names), len(grams)))
+    return {'names': names, 'normalized': normalized, 'grams': grams,
+            'matrix': matrix, 'n': n}
+
+
+# encodings detected this session, keyed by file path, size and
+# modification time; see `detect_encoding`
+FILE_ENCODINGS = {}
+
+
+# function to get the key of a file in `FILE_ENCODINGS`
+def encoding_key(path):
+
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+
+# function to list the encodings to try for a file, detected from its
+# first `sample_size` bytes only: chardet's guess for the sample (utf-8
+# if the sample is ascii, as non-ascii text may follow), then utf-8, then
+# latin-1 (which decodes any bytes)
+def encoding_candidates(path, sample_size=1 << 16):
+
+    import chardet
+    with open(path, 'rb') as file:
+        sample = file.read(sample_size)
+    guess = chardet.detect(sample)['encoding']
+    if guess == 'ascii':
+        guess = 'utf-8'
+    candidates, names = [], set()
+    for encoding in [guess, 'utf-8', 'latin-1']:
+        try:
+            name = codecs.lookup(encoding).name
+        except (LookupError, TypeError):
+            continue
+        if name not in names:
+            candidates.append(encoding)
+            names.add(name)
+    return candidates
+
+
+# function to check that a file decodes with an encoding, streaming it
+# through an incremental decoder one block at a time
+def decodes(path, encoding, blocksize=1 << 20):
+
+    decoder = codecs.getincrementaldecoder(encoding)()
+    try:
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(blocksize), b''):
+                decoder.decode(block)
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+# function to detect (once per session) the encoding of a file, e.g. to
+# pass to `pd.read_csv`; the first candidate the file decodes with
+def detect_encoding(path, sample_size=1 << 16):
+
+    key = encoding_key(path)
+    if key not in FILE_ENCODINGS:
+        candidates = encoding_candidates(path, sample_size)
+        FILE_ENCODINGS[key] = next(encoding for encoding in candidates
+                                   if encoding == candidates[-1] or decodes(path, encoding))
+    return FILE_ENCODINGS[key]
+
+
+# worker function used by `read_ava_cover_tables`: read one cover table
+# and return its encoding and its non-empty cells as a long dataframe
+def read_cover_table(path, encoding=None, header=1, na_values=(),
+                     sample_size=1 << 16):
+
+    # parse with the cached encoding or the encodings detected from a
+    # sample; the next candidate is only tried if decoding fails
+    candidates = [encoding] if encoding else encoding_candidates(path, sample_size)
+    for i, encoding in enumerate(candidates):
+        try:
+            with open(path, newline='', encoding=encoding) as file:
+                rows = [row for row in csv.reader(file) if row]
+            break
+        except UnicodeDecodeError:
+            if i == len(candidates) - 1:
+                raise
+    plots = np.array(rows[header][3:], dtype=object)
+    body = rows[header + 1:]
+    
+    # pad ragged rows and find non-empty cover cells
+    width = len(plots) + 3
+    cells = np.array([(row + [''] * width)[:width] for row in body],
+                     dtype=object).reshape(len(body), width)
+    species = np.char.strip(cells[:, 0].astype(str))
+    covers = np.char.strip(cells[:, 3:].astype(str))
+    keep = ~np.isin(covers, list(na_values) + ['']) & (species != '')[:, None]
+    r, c = np.nonzero(keep)
+    table = pd.DataFrame({'plotName': plots[c],
+                          'datasetSpeciesName': cells[r, 0],
+                          'cover': covers[r, c].astype(object)})
+    return encoding, table